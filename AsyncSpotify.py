@@ -0,0 +1,317 @@
+import asyncio
+import importlib.util
+import time
+from functools import wraps
+
+from spotipy import SpotifyException
+
+from HttpSession import TIMEOUT
+from RequestScheduler import DEFAULT_RETRY_AFTER
+from Snapshot import Snapshot
+from Spotify import Spotify, User, Playlist, PlaylistTrack, Track, Device, PlaybackState, TrackLoader, \
+    TrackLoaderSignals, plan_changed_items, changed_pages, page_item, snapshot_header, saved_track_keys, \
+    collect_new_saved_tracks
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
+API_URL = "https://api.spotify.com/v1/"
+# Connections kept to the API, which is also how many requests are in flight at once
+CONNECTIONS = 16
+# HTTP/2 multiplexes all requests over one connection, httpx only supports it with the h2 package installed
+HTTP2 = importlib.util.find_spec('h2') is not None
+
+
+def install_event_loop(app):
+    # Runs asyncio on the Qt event loop, so coroutines and the GUI share the main thread without blocking it
+    if qasync is None:
+        raise ImportError("Running coroutines on the Qt event loop needs qasync")
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def AsyncThrowsSpotifyException(fn):
+    @wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await fn(self, *args, **kwargs)
+        except SpotifyException as se:
+            print(se.reason)
+            return False
+
+    return wrapper
+
+
+class AsyncSpotify:
+    # Coroutine versions of the Spotify methods, on a single httpx client. Pages are fetched as concurrent tasks on
+    # one thread. The login, rate limit, snapshot cache and known users are shared with the threaded client
+    def __init__(self, spotify: Spotify, connections=CONNECTIONS):
+        if httpx is None:
+            raise ImportError("AsyncSpotify needs httpx, install it with python -m pip install httpx[http2]")
+        self.auth = spotify.sp.auth_manager
+        self.scheduler = spotify.scheduler
+        self.snapshots = spotify.snapshots
+        self.user = spotify.user
+        self.users = spotify.users
+        self.client = httpx.AsyncClient(base_url=API_URL, http2=HTTP2,
+                                        timeout=httpx.Timeout(TIMEOUT[1], connect=TIMEOUT[0]),
+                                        limits=httpx.Limits(max_connections=connections,
+                                                            max_keepalive_connections=connections))
+        self.token = None
+        # Created on first use, so it belongs to the event loop the client is used on
+        self.tokenLock = None
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def auth_headers(self):
+        # Reading and refreshing the token blocks, so it's done on a thread and only once the token expired
+        if self.tokenLock is None:
+            self.tokenLock = asyncio.Lock()
+        async with self.tokenLock:
+            if self.token is None or self.auth.is_token_expired(self.token):
+                self.token = await asyncio.get_running_loop().run_in_executor(None, self.fresh_token)
+        return {'Authorization': f"Bearer {self.token['access_token']}"}
+
+    def fresh_token(self):
+        # Logs in or refreshes the token if necessary, either way the result ends up in the token cache
+        self.auth.get_access_token(as_dict=False)
+        return self.auth.cache_handler.get_cached_token()
+
+    async def request(self, method: str, path: str, interactive=False, **kwargs):
+        # Same policy as RequestScheduler.call, a 429 is always retried and other failures only for reads
+        retryable = method == 'GET'
+        attempt = 0
+        while True:
+            await self.scheduler.acquire_async(interactive)
+            try:
+                response = await self.client.request(method, path, headers=await self.auth_headers(), **kwargs)
+            except httpx.TransportError as te:
+                if not retryable or attempt >= self.scheduler.retries:
+                    raise SpotifyException(-1, -1, f"{path}: {te}", reason=type(te).__name__)
+            else:
+                if response.status_code == 429:
+                    self.scheduler.hold_back(float(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER)))
+                    continue
+                if response.status_code < 500 or not retryable or attempt >= self.scheduler.retries:
+                    if response.is_error:
+                        raise SpotifyException(response.status_code, -1, f"{response.url}:\n {response.text}",
+                                               reason=response.reason_phrase, headers=response.headers)
+                    # Playback controls answer with an empty body
+                    return response.json() if len(response.content) > 0 else None
+            await asyncio.sleep(self.scheduler.retry_delay(attempt))
+            attempt += 1
+
+    async def fetch_pages(self, path: str, firstPage: dict, params=None):
+        # Same as Spotify.__fetch_pages, with every remaining page requested as a task
+        limit = firstPage['limit']
+        pages = [asyncio.ensure_future(self.request('GET', path, params={**(params or {}), 'limit': limit,
+                                                                         'offset': offset}))
+                 for offset in range(firstPage['offset'] + limit, firstPage['total'], limit)]
+        try:
+            for item in firstPage['items']:
+                yield item
+            for page in pages:
+                for item in (await page)['items']:
+                    yield item
+        finally:
+            for page in pages:
+                page.cancel()
+
+    async def get_current_user(self):
+        if self.user is None:
+            self.user = User(await self.request('GET', 'me'))
+            self.users[self.user.id] = self.user
+        return self.user
+
+    async def get_user_playlists(self):
+        firstPage = await self.request('GET', 'me/playlists', params={'limit': Spotify.playlistsPageSize})
+        async for playlist in self.fetch_pages('me/playlists', firstPage):
+            yield Playlist(playlistData=playlist, owner=Spotify.owner(self.users, playlist['owner']))
+
+    @AsyncThrowsSpotifyException
+    async def load_profile(self, user: User):
+        if not user.hasProfile:
+            user.update(await self.request('GET', f"users/{user.id}"))
+
+    async def get_saved_tracks(self, fullSync=False):
+        # Same incremental sync as Spotify.get_saved_tracks, on the same cache file
+        cache = None if fullSync else Spotify.read_saved_tracks()
+
+        liked = await self.request('GET', 'me/tracks', params={'limit': Spotify.savedTracksPageSize})
+
+        if cache is not None:
+            total = liked['total']
+            known = saved_track_keys(cache)
+            newTracks = []
+            while not collect_new_saved_tracks(liked, known, newTracks) and liked['next'] is not None:
+                # The next page link is absolute, which httpx requests as is
+                liked = await self.request('GET', liked['next'])
+            tracks = Spotify.merge_saved_tracks(total, newTracks, cache)
+            if tracks is not None:
+                for i, track in enumerate(tracks):
+                    yield PlaylistTrack(track, i + 1)
+                return
+
+        tracks = []
+        pages = self.fetch_pages('me/tracks', liked)
+        try:
+            async for track in pages:
+                track['is_local'] = False  # You can't like local tracks
+                tracks.append(track)
+                yield PlaylistTrack(track, len(tracks))
+        finally:
+            await pages.aclose()
+        Spotify.store_saved_tracks(liked['total'], tracks)
+
+    async def get_playlist_tracks(self, playlist: Playlist):
+        if self.snapshots.has(playlist.id, playlist.snapshotId):
+            with self.snapshots.open(playlist.id, playlist.snapshotId) as snapshot:
+                for i, track in enumerate(snapshot.items()):
+                    yield PlaylistTrack(track, i + 1)
+            return
+
+        header = snapshot_header(playlist)
+        items = []
+
+        # Same delta sync as Spotify.get_playlist_tracks
+        previous = self.snapshots.open_previous(playlist.id)
+        if previous is None:
+            fetchedItems = self.fetch_playlist_items(playlist)
+        else:
+            fetchedItems = self.fetch_changed_playlist_items(playlist, previous)
+        try:
+            async for track in fetchedItems:
+                items.append(track)
+                yield PlaylistTrack(track, len(items))
+        finally:
+            await fetchedItems.aclose()
+            if previous is not None:
+                previous.close()
+
+        self.snapshots.store(playlist.id, header['snapshot_id'], header, items)
+
+    async def fetch_playlist_items(self, playlist: Playlist):
+        path = f"playlists/{playlist.id}/tracks"
+        params = {'fields': Spotify.playlistItemsFields}
+        firstPage = await self.request('GET', path, params={**params, 'limit': Spotify.playlistPageSize})
+        pages = self.fetch_pages(path, firstPage, params)
+        try:
+            async for track in pages:
+                # Some playlist items might not have the track property
+                if track['track'] is not None:
+                    yield track
+        finally:
+            await pages.aclose()
+
+    async def fetch_changed_playlist_items(self, playlist: Playlist, previous: Snapshot):
+        path = f"playlists/{playlist.id}/tracks"
+        params = {'fields': Spotify.fingerprintFields}
+        firstPage = await self.request('GET', path, params={**params, 'limit': Spotify.playlistPageSize})
+        fingerprints = [fingerprint async for fingerprint in self.fetch_pages(path, firstPage, params)]
+        plan = plan_changed_items(previous, fingerprints)
+
+        pageSize = Spotify.playlistPageSize
+        itemParams = {'fields': Spotify.playlistItemsFields, 'limit': pageSize}
+        pages = {page: asyncio.ensure_future(self.request('GET', path, params={**itemParams, 'offset': page * pageSize}))
+                 for page in changed_pages(plan, pageSize)}
+        try:
+            for position, row in plan:
+                if row is not None:
+                    yield previous.item(row)
+                    continue
+                item = page_item((await pages[position // pageSize])['items'], position, pageSize)
+                if item is not None:
+                    yield item
+        finally:
+            for page in pages.values():
+                page.cancel()
+
+    async def get_current_playback(self):
+        playback = await self.request('GET', 'me/player', interactive=True)
+        if playback is None:
+            return None, None, None
+        if playback['device']['is_private_session']:
+            return None, Device(playback['device']), None
+        track = None if playback['item'] is None else Track(playback['item'])
+        return track, Device(playback['device']), PlaybackState(shuffle=playback['shuffle_state'],
+                                                                playing=playback['is_playing'],
+                                                                loop=playback['repeat_state'],
+                                                                position=playback['progress_ms'])
+
+    @AsyncThrowsSpotifyException
+    async def set_shuffle(self, state: bool):
+        await self.request('PUT', 'me/player/shuffle', interactive=True,
+                           params={'state': 'true' if state else 'false'})
+
+    @AsyncThrowsSpotifyException
+    async def previous_track(self):
+        await self.request('POST', 'me/player/previous', interactive=True)
+
+    @AsyncThrowsSpotifyException
+    async def play_pause(self, play: bool):
+        await self.request('PUT', 'me/player/play' if play else 'me/player/pause', interactive=True)
+
+    @AsyncThrowsSpotifyException
+    async def next_track(self):
+        await self.request('POST', 'me/player/next', interactive=True)
+
+    @AsyncThrowsSpotifyException
+    async def set_volume(self, value):
+        await self.request('PUT', 'me/player/volume', interactive=True, params={'volume_percent': value})
+
+    @AsyncThrowsSpotifyException
+    async def play_track(self, context, targetUri):
+        if "spotify:local" not in targetUri:
+            if context == '':
+                await self.request('PUT', 'me/player/play', interactive=True, json={'uris': [targetUri]})
+            else:
+                await self.request('PUT', 'me/player/play', interactive=True,
+                                   json={'context_uri': context, 'offset': {'uri': targetUri}})
+            return True
+
+    @AsyncThrowsSpotifyException
+    async def play_playlist(self, playlist: Playlist):
+        await self.request('PUT', 'me/player/play', interactive=True, json={'context_uri': playlist.playlistUri})
+
+
+class AsyncTrackLoader:
+    # The coroutine counterpart of TrackLoader, with the same signals. Runs as a task on the event loop
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.signals = TrackLoaderSignals()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        batch = []
+        lastBatch = time.perf_counter()
+        try:
+            async for track in self.tracks:
+                batch.append(track)
+                if time.perf_counter() - lastBatch >= TrackLoader.batchInterval:
+                    self.signals.tracksReady.emit(batch)
+                    batch = []
+                    # Cached tracks never wait for the network, this lets the GUI draw the batch
+                    await asyncio.sleep(0)
+                    lastBatch = time.perf_counter()
+            self.signals.tracksReady.emit(batch)
+        except SpotifyException as se:
+            print(se.reason)
+        finally:
+            await self.tracks.aclose()
+            self.signals.finished.emit()
@@ -1,12 +1,224 @@
+import atexit
+import hashlib
 import os.path
+import sqlite3
+from collections import OrderedDict
 
 import requests
+from HttpSession import session
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
 from PyQt5.QtGui import QPixmap
-import json
 
 
 # TODO: Sometimes the passed uri is none - should be investigated
 
+class ImageCache:
+    # Images are stored under a digest of their URL, so the same image maps to the same file in every run.
+    # The index lives in SQLite and is read once per process, changes to it are written in batches
+    flushInterval = 100
+
+    def __init__(self, directory='./cache/img', indexPath='./cache/.imgindex', diskQuota=256 * 1024 * 1024):
+        self.directory = directory
+        self.diskQuota = diskQuota
+        # File name -> size in bytes, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        # Index rows to be written (file name -> last use) or deleted on the next flush
+        self.dirty = dict()
+        self.removed = set()
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        seedIndex = not os.path.exists(indexPath)
+        self.index = sqlite3.connect(indexPath)
+        self.index.execute("CREATE TABLE IF NOT EXISTS images (name TEXT PRIMARY KEY, size INTEGER, lastUsed REAL)")
+        # Counter ordering uses of cached images, it only has to grow
+        self.clock = 0
+
+        if seedIndex:
+            # Files cached before the index existed are picked up with their modification times as recency
+            rows = [(entry.name, entry.stat().st_size, entry.stat().st_mtime)
+                    for entry in os.scandir(self.directory) if entry.is_file()]
+            with self.index:
+                self.index.executemany("INSERT INTO images VALUES (?, ?, ?)", rows)
+
+        for name, size, lastUsed in self.index.execute("SELECT name, size, lastUsed FROM images ORDER BY lastUsed"):
+            self.entries[name] = size
+            self.size += size
+            self.clock = lastUsed
+
+        # Index left over from when files were named by a per-process hash. Those files were never hit again,
+        # so they are the oldest entries and get evicted first
+        if os.path.exists('./cache/.imgcache'):
+            os.remove('./cache/.imgcache')
+        self.evict()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def file_name(uri: str):
+        return hashlib.sha1(uri.encode()).hexdigest()
+
+    def __contains__(self, uri: str):
+        return self.file_name(uri) in self.entries
+
+    def get(self, uri: str):
+        name = self.file_name(uri)
+        if name not in self.entries:
+            return None
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.size -= self.entries.pop(name)
+            self.mark_removed(name)
+            return None
+        self.entries.move_to_end(name)
+        self.mark_dirty(name)
+        return data
+
+    def put(self, uri: str, data: bytes):
+        name = self.file_name(uri)
+        with open(os.path.join(self.directory, name), 'wb') as file:
+            file.write(data)
+        self.size += len(data) - self.entries.pop(name, 0)
+        self.entries[name] = len(data)
+        self.mark_dirty(name)
+        self.evict()
+
+    def remove(self, uri: str):
+        name = self.file_name(uri)
+        if name in self.entries:
+            self.size -= self.entries.pop(name)
+            self.mark_removed(name)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        while self.size > self.diskQuota and len(self.entries) > 0:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.mark_removed(name)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def mark_dirty(self, name: str):
+        self.clock += 1
+        self.removed.discard(name)
+        self.dirty[name] = self.clock
+        if len(self.dirty) + len(self.removed) >= self.flushInterval:
+            self.flush()
+
+    def mark_removed(self, name: str):
+        self.dirty.pop(name, None)
+        self.removed.add(name)
+        if len(self.dirty) + len(self.removed) >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        with self.index:
+            self.index.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?)",
+                                   [(name, self.entries[name], lastUsed) for name, lastUsed in self.dirty.items()])
+            self.index.executemany("DELETE FROM images WHERE name = ?", [(name,) for name in self.removed])
+        self.dirty.clear()
+        self.removed.clear()
+
+
+class PixmapCache:
+    # Decoded and scaled pixmaps keyed by (uri, size), bounded by the memory the pixmaps take up
+    def __init__(self, memoryQuota=64 * 1024 * 1024):
+        self.memoryQuota = memoryQuota
+        # (uri, size) -> pixmap, least recently used first
+        self.pixmaps = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def pixmap_size(pixmap: QPixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, key: tuple):
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+        return pixmap
+
+    def discard(self, key: tuple):
+        if key in self.pixmaps:
+            self.size -= self.pixmap_size(self.pixmaps.pop(key))
+
+    def put(self, key: tuple, pixmap: QPixmap):
+        self.discard(key)
+        self.pixmaps[key] = pixmap
+        self.size += self.pixmap_size(pixmap)
+        while self.size > self.memoryQuota and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.size -= self.pixmap_size(evicted)
+
+
+class ImageDownload(QRunnable):
+    def __init__(self, uri: str, downloaded: pyqtSignal):
+        super().__init__()
+        self.uri = uri
+        self.downloaded = downloaded
+
+    def run(self):
+        data = None
+        try:
+            response = session.get(self.uri)
+            if response.ok:
+                data = response.content
+            else:
+                print(f"{self.uri}: {response.status_code}")
+        except requests.RequestException as e:
+            print(e)
+        self.downloaded.emit(self.uri, data)
+
+
+class ImageLoader(QObject):
+    # Emitted on the GUI thread once an image is in the cache and can be fetched without blocking
+    imageReady = pyqtSignal(str)
+    downloaded = pyqtSignal(str, object)
+
+    # Priorities of queued downloads, covers that are currently on screen should go first
+    visiblePriority = 1
+    backgroundPriority = 0
+
+    def __init__(self, workers=4):
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(workers)
+        # Identical URLs are only downloaded once, no matter how many rows asked for them
+        self.inFlight = set()
+        # URLs that failed to download or aren't images. Rows ask again on every repaint, so these aren't
+        # retried for the rest of the session and keep their placeholder
+        self.failed = set()
+        self.downloaded.connect(self.download_finished)
+
+    def request(self, uri: str, priority=visiblePriority):
+        if uri in self.inFlight or uri in self.failed:
+            return
+        self.inFlight.add(uri)
+        self.pool.start(ImageDownload(uri, self.downloaded), priority)
+
+    def download_finished(self, uri: str, data: bytes):
+        # Only the GUI thread touches the image cache, workers just download
+        self.inFlight.discard(uri)
+        # Anything that isn't an image would be served from the cache forever instead of the placeholder
+        if data is not None and QPixmap().loadFromData(data):
+            imageCache.put(uri, data)
+            self.imageReady.emit(uri)
+        else:
+            self.failed.add(uri)
+
+
+imageCache = ImageCache()
+pixmapCache = PixmapCache()
+imageLoader = ImageLoader()
+
+
 def get_image(uri: str):
 
     # bad
@@ -16,26 +228,50 @@ def get_image(uri: str):
     if uri.startswith(":/"):
         return QPixmap(uri)
 
-    if not os.path.exists('./cache/.imgcache'):
-        os.makedirs('./cache/img')
-        fi = open('./cache/.imgcache', 'w')
-        json.dump({}, fi)
-        fi.close()
-
-    with open('./cache/.imgcache', 'r') as cacheFile:
-        cache = json.load(cacheFile)
-        if uri in cache.keys():
-            image = QPixmap()
-            with open(f"./cache/img/{cache[uri]}", 'rb') as file:
-                image.loadFromData(file.read())
-                return image
-        else:
-            data = requests.get(uri, stream=True).raw.read()
-            with open(f"./cache/img/{hash(data)}", 'wb') as file:
-                file.write(data)
-            cache[uri] = hash(data)
-            image = QPixmap()
-            image.loadFromData(data)
-    with open('./cache/.imgcache', 'w') as cacheFile:
-        json.dump(cache, cacheFile)
-        return image
+    # Never downloads, this runs on the GUI thread. Images that aren't cached, including ones whose file has gone
+    # missing, come back null so callers show their placeholder and request them from imageLoader
+    image = QPixmap()
+    data = imageCache.get(uri)
+    if data is not None and not image.loadFromData(data):
+        # Cached before responses were checked, e.g. the body of a 404
+        imageCache.remove(uri)
+    return image
+
+
+def get_scaled_image(uri: str, size: int):
+    # Most covers are shared by many rows, so each one is decoded and scaled only once per size
+    key = (uri, size)
+    pixmap = pixmapCache.get(key)
+    if pixmap is None:
+        pixmap = get_image(uri)
+        if not pixmap.isNull():
+            pixmap = pixmap.scaled(size, size, transformMode=Qt.SmoothTransformation)
+            pixmapCache.put(key, pixmap)
+    return pixmap
+
+
+def request_scaled_image(uri: str, size: int, placeholder: str, priority=ImageLoader.visiblePriority):
+    # Returns the placeholder if the image still has to be downloaded, imageLoader.imageReady tells when it's there
+    if uri is None:
+        return get_scaled_image(placeholder, size)
+    if uri.startswith(":/") or pixmapCache.get((uri, size)) is not None:
+        return get_scaled_image(uri, size)
+    if uri in imageCache:
+        pixmap = get_scaled_image(uri, size)
+        # Cached data that isn't an image or whose file is gone was dropped from the cache, so it's downloaded again
+        if not pixmap.isNull():
+            return pixmap
+    imageLoader.request(uri, priority)
+    return get_scaled_image(placeholder, size)
+
+
+def prefetch_scaled_image(uri: str, size: int):
+    # Gets an image ready for request_scaled_image, without holding up downloads of images that are on screen
+    if uri is None or uri.startswith(":/") or pixmapCache.get((uri, size)) is not None:
+        return
+    if uri not in imageCache or get_scaled_image(uri, size).isNull():
+        imageLoader.request(uri, ImageLoader.backgroundPriority)
+
+
+def release_scaled_image(uri: str, size: int):
+    pixmapCache.discard((uri, size))
@@ -0,0 +1,30 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Keep-alive connections kept per host, should cover all threads that use the session at once
+POOL_SIZE = 16
+RETRIES = 3
+# Connect and read timeouts in seconds
+TIMEOUT = (5, 15)
+
+
+class PooledSession(requests.Session):
+    def __init__(self, poolSize=POOL_SIZE, retries=RETRIES, timeout=TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        # Only failed connects are retried here, the request never reached the server so that's safe for any method.
+        # Server errors, timeouts and dropped connections are left to RequestScheduler, which retries reads only
+        retry = Retry(total=None, connect=retries, read=False, status=0, redirect=None, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+# Shared by image downloads and the Spotify client, so connections to the API and the image CDN are reused
+session = PooledSession()
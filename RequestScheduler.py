@@ -0,0 +1,139 @@
+import asyncio
+import random
+import threading
+import time
+
+import requests
+from spotipy import SpotifyException
+
+# Sustained Web API requests per second, and how many can be sent at once after being idle
+RATE = 10
+BURST = 20
+# Tokens only interactive requests may take, so playback controls don't queue behind page fetches
+INTERACTIVE_RESERVE = 2
+# Retries of reads that failed with a server error, timeout or dropped connection. HttpSession only retries
+# failed connects, so these are the only retries a server error gets
+RETRIES = 4
+# Interactive calls are made on the GUI thread, so they give up rather than wait longer than this for a Retry-After
+MAX_INTERACTIVE_WAIT = 2
+# Base of the exponential backoff between retries of transient failures, in seconds
+BACKOFF = 0.5
+# Used when a 429 response doesn't say how long to wait
+DEFAULT_RETRY_AFTER = 1
+# spotipy methods that only read. Anything else may have been applied even if it failed or timed out, so retrying it
+# could add tracks twice or skip two tracks for one click
+READ_METHODS = frozenset({'current_user', 'current_user_playlists', 'current_user_saved_tracks', 'user', 'next',
+                          'playlist', 'playlist_items', 'current_playback', 'devices'})
+
+
+class RequestScheduler:
+    # Token bucket shared by every call to the Web API. Calls are made on the caller's thread, the scheduler only
+    # decides when. A 429 response holds back all calls for as long as Retry-After asks
+    def __init__(self, rate=RATE, burst=BURST, interactiveReserve=INTERACTIVE_RESERVE, retries=RETRIES,
+                 backoff=BACKOFF, maxInteractiveWait=MAX_INTERACTIVE_WAIT):
+        self.rate = rate
+        self.burst = burst
+        self.interactiveReserve = interactiveReserve
+        self.retries = retries
+        self.backoff = backoff
+        self.maxInteractiveWait = maxInteractiveWait
+        self.tokens = burst
+        self.lastRefill = time.monotonic()
+        self.blockedUntil = 0
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def proxy(self, client, interactive: bool):
+        return ScheduledClient(client, self, interactive)
+
+    def acquire(self, interactive: bool):
+        with self.condition:
+            while True:
+                wait = self.take_token(interactive)
+                if wait == 0:
+                    return
+                self.condition.wait(wait)
+
+    async def acquire_async(self, interactive: bool):
+        # For coroutines on the event loop, which must not block on the condition
+        while True:
+            with self.condition:
+                wait = self.take_token(interactive)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def take_token(self, interactive: bool):
+        # Takes a token and returns 0, or returns how long to wait before trying again. Must hold the condition
+        if self.closed:
+            raise SpotifyException(-1, -1, "Not sending requests while closing", reason="Closing")
+        needed = 1 if interactive else 1 + self.interactiveReserve
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.lastRefill) * self.rate)
+        self.lastRefill = now
+        if now < self.blockedUntil:
+            retryAfter = self.blockedUntil - now
+            if interactive and retryAfter > self.maxInteractiveWait:
+                raise SpotifyException(429, -1, f"Rate limited for another {retryAfter:.0f} s",
+                                       reason="Rate limited", headers={'Retry-After': str(retryAfter)})
+            return retryAfter
+        if self.tokens >= needed:
+            self.tokens -= 1
+            return 0
+        return (needed - self.tokens) / self.rate
+
+    def retry_delay(self, attempt: int):
+        # Full jitter, so calls that failed together don't retry together
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def close(self):
+        # Calls waiting for their turn give up, so nothing holds up quitting
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def hold_back(self, seconds: float):
+        with self.condition:
+            self.blockedUntil = max(self.blockedUntil, time.monotonic() + seconds)
+            # Tokens saved up before the 429 would just trigger another one
+            self.tokens = 0
+            self.condition.notify_all()
+
+    def call(self, function, interactive: bool, retryable: bool, *args, **kwargs):
+        # A 429 is always retried, Spotify didn't apply the call. Other failures only if the call is retryable
+        attempt = 0
+        while True:
+            self.acquire(interactive)
+            try:
+                return function(*args, **kwargs)
+            except SpotifyException as se:
+                if se.http_status == 429:
+                    # Rate limited calls are retried for as long as it takes, they don't count as attempts
+                    retryAfter = (se.headers or {}).get('Retry-After', DEFAULT_RETRY_AFTER)
+                    self.hold_back(float(retryAfter))
+                    continue
+                if se.http_status < 500 or not retryable or attempt >= self.retries:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                if not retryable or attempt >= self.retries:
+                    raise
+            time.sleep(self.retry_delay(attempt))
+            attempt += 1
+
+
+class ScheduledClient:
+    # Stands in for a spotipy client, its methods are called through the scheduler
+    def __init__(self, client, scheduler: RequestScheduler, interactive: bool):
+        self.client = client
+        self.scheduler = scheduler
+        self.interactive = interactive
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def scheduled(*args, **kwargs):
+            return self.scheduler.call(attribute, self.interactive, name in READ_METHODS, *args, **kwargs)
+
+        return scheduled
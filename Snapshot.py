@@ -0,0 +1,305 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Playlist snapshots are stored in a columnar binary layout, holding only the fields Track and PlaylistTrack read.
+# Every text field is an index into a string table, so the file can be memory mapped and read without parsing.
+#
+# Layout, all integers are little-endian 32 bit:
+#   magic, version, header length, header (JSON with the playlist details, padded to 4 bytes)
+#   track count, artist credit count, string count, string data length
+#   per track columns: title, uri, album, cover uri, release date, added at, duration, is local
+#   per track artist credit start, plus one entry marking the end of the last track's credits
+#   per artist credit columns: name, uri
+#   string offsets (string count + 1) and the UTF-8 string data
+# Missing strings are stored as -1
+
+MAGIC = b'SPSN'
+VERSION = 1
+
+TRACK_COLUMNS = ('title', 'uri', 'album', 'cover', 'releaseDate', 'addedAt', 'duration', 'isLocal')
+CREDIT_COLUMNS = ('artistName', 'artistUri')
+
+
+class StringTable:
+    def __init__(self):
+        self.ids = dict()
+        self.data = bytearray()
+        self.offsets = [0]
+
+    def add(self, string):
+        if string is None:
+            return -1
+        stringId = self.ids.get(string)
+        if stringId is None:
+            stringId = self.ids[string] = len(self.offsets) - 1
+            self.data += string.encode()
+            self.offsets.append(len(self.data))
+        return stringId
+
+
+def pack_ints(values):
+    return struct.pack(f'<{len(values)}i', *values)
+
+
+def write_snapshot(path: str, header: dict, items: list):
+    strings = StringTable()
+    columns = {column: [] for column in TRACK_COLUMNS + CREDIT_COLUMNS}
+    creditStarts = [0]
+    for item in items:
+        track = item['track']
+        try:
+            cover = track['album']['images'][-1]['url']
+        except IndexError:
+            cover = None
+        columns['title'].append(strings.add(track['name']))
+        columns['uri'].append(strings.add(track['uri']))
+        columns['album'].append(strings.add(track['album']['name']))
+        columns['cover'].append(strings.add(cover))
+        columns['releaseDate'].append(strings.add(track['album']['release_date']))
+        columns['addedAt'].append(strings.add(item['added_at']))
+        columns['duration'].append(track['duration_ms'])
+        columns['isLocal'].append(int(item['is_local']))
+        for artist in track['artists']:
+            columns['artistName'].append(strings.add(artist['name']))
+            columns['artistUri'].append(strings.add(artist['uri']))
+        creditStarts.append(len(columns['artistName']))
+
+    headerData = json.dumps(header).encode()
+    headerData += b' ' * (-len(headerData) % 4)
+
+    # Written next to the target and moved over it, so a snapshot file is never seen half written
+    with open(path + '.tmp', 'wb') as snapshotFile:
+        snapshotFile.write(MAGIC + struct.pack('<2i', VERSION, len(headerData)) + headerData)
+        snapshotFile.write(struct.pack('<4i', len(items), len(columns['artistName']), len(strings.offsets) - 1,
+                                       len(strings.data)))
+        for column in TRACK_COLUMNS:
+            snapshotFile.write(pack_ints(columns[column]))
+        snapshotFile.write(pack_ints(creditStarts))
+        for column in CREDIT_COLUMNS:
+            snapshotFile.write(pack_ints(columns[column]))
+        snapshotFile.write(pack_ints(strings.offsets))
+        snapshotFile.write(strings.data)
+    os.replace(path + '.tmp', path)
+
+
+class Snapshot:
+    def __init__(self, path: str):
+        with open(path, 'rb') as snapshotFile:
+            self.map = mmap.mmap(snapshotFile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = view = memoryview(self.map)
+        if bytes(view[:4]) != MAGIC:
+            raise ValueError(f"{path} is not a binary snapshot")
+        version, headerLength = struct.unpack_from('<2i', self.map, 4)
+        if version != VERSION:
+            raise ValueError(f"{path} has unsupported snapshot version {version}")
+        self.header = json.loads(bytes(view[12:12 + headerLength]))
+        offset = 12 + headerLength
+        count, creditCount, stringCount, dataLength = struct.unpack_from('<4i', self.map, offset)
+        offset += 16
+
+        self.columns = dict()
+
+        def column(length):
+            nonlocal offset
+            values = view[offset:offset + 4 * length].cast('i')
+            offset += 4 * length
+            return values
+
+        for name in TRACK_COLUMNS:
+            self.columns[name] = column(count)
+        self.columns['creditStart'] = column(count + 1)
+        for name in CREDIT_COLUMNS:
+            self.columns[name] = column(creditCount)
+        self.stringOffsets = column(stringCount + 1)
+        self.stringData = view[offset:offset + dataLength]
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # Views into the map have to be released before it can be closed
+        for values in self.columns.values():
+            values.release()
+        self.stringOffsets.release()
+        self.stringData.release()
+        self.view.release()
+        self.map.close()
+
+    def string(self, stringId: int):
+        if stringId == -1:
+            return None
+        return str(self.stringData[self.stringOffsets[stringId]:self.stringOffsets[stringId + 1]], 'utf-8')
+
+    def item(self, row: int):
+        # The same shape as a playlist item returned by Spotify, limited to the stored fields
+        columns = self.columns
+        cover = self.string(columns['cover'][row])
+        return {'added_at': self.string(columns['addedAt'][row]),
+                'is_local': bool(columns['isLocal'][row]),
+                'track': {'name': self.string(columns['title'][row]),
+                          'uri': self.string(columns['uri'][row]),
+                          'duration_ms': columns['duration'][row],
+                          'artists': [{'name': self.string(columns['artistName'][credit]),
+                                       'uri': self.string(columns['artistUri'][credit])}
+                                      for credit in range(columns['creditStart'][row],
+                                                          columns['creditStart'][row + 1])],
+                          'album': {'name': self.string(columns['album'][row]),
+                                    'release_date': self.string(columns['releaseDate'][row]),
+                                    'images': [] if cover is None else [{'url': cover}]}}}
+
+    def items(self):
+        for row in range(self.count):
+            yield self.item(row)
+
+
+def open_snapshot(path: str):
+    # Snapshots cached as raw JSON by older versions are converted the first time they are read
+    with open(path, 'rb') as snapshotFile:
+        isJson = snapshotFile.read(1) == b'{'
+    if isJson:
+        with open(path, 'r') as snapshotFile:
+            snapshot = json.load(snapshotFile)
+        items = snapshot.pop('tracks')
+        write_snapshot(path, snapshot, [item for item in items if item['track'] is not None])
+    return Snapshot(path)
+
+
+def read_playlist_id(path: str, prefixLength=64 * 1024):
+    # Reads only as much of a snapshot as it takes to find the playlist id, without converting old JSON snapshots
+    with open(path, 'rb') as snapshotFile:
+        prefix = snapshotFile.read(prefixLength)
+    if prefix[:4] == MAGIC:
+        version, headerLength = struct.unpack_from('<2i', prefix, 4)
+        if version != VERSION:
+            raise ValueError(f"{path} has unsupported snapshot version {version}")
+        with open(path, 'rb') as snapshotFile:
+            snapshotFile.seek(12)
+            return json.loads(snapshotFile.read(headerLength))['id']
+    # Old JSON snapshots hold the playlist details before the tracks, so only the keys leading up to them are parsed
+    decoder = json.JSONDecoder()
+    text = prefix.decode('utf-8', errors='ignore')
+    if not text.startswith('{'):
+        raise ValueError(f"{path} is not a snapshot")
+    position = 1
+    while True:
+        position = len(text) - len(text[position:].lstrip(' \n\r\t,'))
+        key, position = decoder.raw_decode(text, position)
+        position = text.index(':', position) + 1
+        position = len(text) - len(text[position:].lstrip())
+        if key == 'id':
+            return decoder.raw_decode(text, position)[0]
+        if key == 'tracks':
+            raise KeyError(f"{path} has no playlist id")
+        _, position = decoder.raw_decode(text, position)
+
+
+class SnapshotCache:
+    # Keeps the current snapshot id of every cached playlist in an index, so checking for a snapshot doesn't scan
+    # the directory. Superseded snapshots are deleted, and least recently used ones once the disk quota is exceeded
+    def __init__(self, directory='./cache/playlists', diskQuota=512 * 1024 * 1024):
+        self.directory = directory
+        self.diskQuota = diskQuota
+        self.indexPath = os.path.join(directory, '.index')
+        # Snapshots are stored and opened from track loader threads
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath, 'r') as indexFile:
+                self.index = json.load(indexFile)
+        else:
+            self.index = self.build_index()
+            self.save_index()
+
+    def path(self, snapshotId: str):
+        return os.path.join(self.directory, snapshotId)
+
+    def build_index(self):
+        # Snapshots cached before the index existed, only the newest one of every playlist is kept
+        index = dict()
+        # Old JSON snapshots are converted when they're first opened, not here
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime):
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            if entry.name.endswith('.tmp'):
+                # Left over from a write that was interrupted
+                self.remove(entry.name)
+                continue
+            try:
+                playlistId = read_playlist_id(entry.path)
+            except (ValueError, KeyError, TypeError, struct.error):
+                self.remove(entry.name)
+                continue
+            if playlistId in index:
+                self.remove(index[playlistId]['snapshotId'])
+            index[playlistId] = {'snapshotId': entry.name, 'size': os.path.getsize(entry.path),
+                                 'lastUsed': entry.stat().st_mtime}
+        return index
+
+    def save_index(self):
+        with open(self.indexPath + '.tmp', 'w') as indexFile:
+            json.dump(self.index, indexFile)
+        os.replace(self.indexPath + '.tmp', self.indexPath)
+
+    def remove(self, snapshotId: str):
+        try:
+            os.remove(self.path(snapshotId))
+        except OSError:
+            # Already gone, or still mapped by a reader on platforms that don't allow removing it
+            pass
+
+    def has(self, playlistId: str, snapshotId: str):
+        entry = self.index.get(playlistId)
+        return entry is not None and entry['snapshotId'] == snapshotId and os.path.exists(self.path(snapshotId))
+
+    def previous(self, playlistId: str):
+        # Id of the cached snapshot of a playlist, even if the playlist has changed since
+        entry = self.index.get(playlistId)
+        return None if entry is None else entry['snapshotId']
+
+    def open_previous(self, playlistId: str):
+        # The cached snapshot of a playlist that has changed since, or None if there isn't one
+        previousSnapshotId = self.previous(playlistId)
+        if previousSnapshotId is None or not self.has(playlistId, previousSnapshotId):
+            return None
+        return self.open(playlistId, previousSnapshotId)
+
+    def open(self, playlistId: str, snapshotId: str):
+        with self.lock:
+            self.index[playlistId]['lastUsed'] = time.time()
+            self.save_index()
+        return open_snapshot(self.path(snapshotId))
+
+    def store(self, playlistId: str, snapshotId: str, header: dict, items: list):
+        write_snapshot(self.path(snapshotId), header, items)
+        with self.lock:
+            previous = self.index.get(playlistId)
+            if previous is not None and previous['snapshotId'] != snapshotId:
+                self.remove(previous['snapshotId'])
+            self.index[playlistId] = {'snapshotId': snapshotId, 'size': os.path.getsize(self.path(snapshotId)),
+                                      'lastUsed': time.time()}
+            self.evict(playlistId)
+            self.save_index()
+
+    def evict(self, keptPlaylistId: str):
+        size = sum(entry['size'] for entry in self.index.values())
+        for playlistId in sorted(self.index.keys(), key=lambda playlistId: self.index[playlistId]['lastUsed']):
+            if size <= self.diskQuota:
+                break
+            if playlistId == keptPlaylistId:
+                continue
+            entry = self.index.pop(playlistId)
+            self.remove(entry['snapshotId'])
+            size -= entry['size']
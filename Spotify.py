@@ -1,16 +1,21 @@
 import datetime
-import json
 import os
+import struct
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 import spotipy
-from PyQt5.QtCore import QObject, pyqtSignal, QRunnable
+from PyQt5.QtCore import QObject, pyqtSignal, QRunnable, QThread
 from spotipy import SpotifyOAuth, SpotifyException
+from HttpSession import session
+from RequestScheduler import RequestScheduler
+from Snapshot import open_snapshot, write_snapshot, Snapshot, SnapshotCache
 from Secrets import SPOTIPY_CLIENT_ID, SPOTIPY_CLIENT_SECRET, SPOTIPY_REDIRECT_URI
 
 
-# TODO: Store snapshot returned by reordering tracks
-
 class PlaybackState:
     def __init__(self, shuffle=None, playing=None, loop=None, position=None):
         self.shuffle = shuffle
@@ -21,14 +26,19 @@ class PlaybackState:
 
 class User:
     def __init__(self, userData):
+        self.update(userData)
+
+    def update(self, userData):
         self.json = userData
         self.name = userData['display_name']
         try:
             self.image = userData['images'][0]['url']
-        except IndexError:
+        except (IndexError, KeyError):
             self.image = None
         self.id = userData['id']
         self.uri = userData['uri']
+        # Owners embedded in playlists have no pictures, the full profile is only looked up when one is shown
+        self.hasProfile = 'images' in userData
 
 
 class Device:
@@ -58,27 +68,106 @@ class Playlist:
         self.playlistUri = playlistData['uri']
 
 
+class Artist:
+    __slots__ = ('name', 'uri')
+
+    # Artists are shared by all tracks that credit them
+    registry = dict()
+
+    def __init__(self, name: str, uri: str):
+        self.name = name
+        self.uri = uri
+
+    @classmethod
+    def get(cls, name: str, uri: str):
+        artist = cls.registry.get((name, uri))
+        if artist is None:
+            artist = cls.registry.setdefault((name, uri), cls(name, uri))
+        return artist
+
+
+class Credits:
+    __slots__ = ('artists', 'names', 'uris')
+
+    # Most tracks share their combination of artists with other tracks
+    registry = dict()
+
+    def __init__(self, artists: tuple):
+        self.artists = artists
+        self.names = tuple(artist.name for artist in artists)
+        self.uris = tuple(artist.uri for artist in artists)
+
+    @classmethod
+    def get(cls, artists: tuple):
+        credits = cls.registry.get(artists)
+        if credits is None:
+            credits = cls.registry.setdefault(artists, cls(artists))
+        return credits
+
+
+class Album:
+    __slots__ = ('name', 'coverUri', 'year')
+
+    # Albums are shared by all their tracks
+    registry = dict()
+
+    def __init__(self, name: str, coverUri: str, year):
+        self.name = name
+        self.coverUri = coverUri
+        self.year = year
+
+    @classmethod
+    def get(cls, name: str, coverUri: str, year):
+        album = cls.registry.get((name, coverUri, year))
+        if album is None:
+            album = cls.registry.setdefault((name, coverUri, year), cls(name, coverUri, year))
+        return album
+
+
 class Track:
+    __slots__ = ('title', 'runtime', 'trackUri', 'credits', 'albumRecord')
+
     def __init__(self, trackData: dict):
         if trackData is None:
             return
         try:
-            self.albumCoverUri: str = trackData['album']['images'][-1]['url']
+            albumCoverUri = trackData['album']['images'][-1]['url']
         except IndexError:
-            self.albumCoverUri = None
+            albumCoverUri = None
+        try:
+            year = trackData['album']['release_date'].split(sep="-")[0]
+        except AttributeError:
+            year = datetime.datetime.year
         self.title = trackData['name']
-        self.artists = [artist['name'] for artist in trackData['artists']]
-        self.artistUris = [artist['uri'] for artist in trackData['artists']]
-        self.album = trackData['album']['name']
+        self.credits = Credits.get(tuple(Artist.get(artist['name'], artist['uri']) for artist in trackData['artists']))
+        self.albumRecord = Album.get(trackData['album']['name'], albumCoverUri, year)
         self.runtime: int = trackData['duration_ms']
         self.trackUri = trackData['uri']
-        try:
-            self.year = trackData['album']['release_date'].split(sep="-")[0]
-        except AttributeError:
-            self.year = datetime.datetime.year
+
+    @property
+    def artists(self):
+        return self.credits.names
+
+    @property
+    def artistUris(self):
+        return self.credits.uris
+
+    @property
+    def album(self):
+        return self.albumRecord.name
+
+    @property
+    def albumCoverUri(self):
+        return self.albumRecord.coverUri
+
+    @property
+    def year(self):
+        return self.albumRecord.year
 
 
 class PlaylistTrack:
+    __slots__ = ('index', 'addedAt', 'isLocal', 'track')
+
     def __init__(self, playlistTrackData, index):
         self.index = index
         self.addedAt = playlistTrackData['added_at']
@@ -89,6 +178,79 @@ class PlaylistTrack:
         self.track = Track(playlistTrackData['track'])
 
 
+# Fields of a playlist item that PlaylistTrack and Track read, nested objects map to their own fields.
+# Requests for playlist items ask for these only, which leaves out available_markets and everything else unused
+playlistItemSchema = {'added_at': None,
+                      'is_local': None,
+                      'track': {'name': None,
+                                'uri': None,
+                                'duration_ms': None,
+                                'artists': {'name': None, 'uri': None},
+                                'album': {'name': None, 'release_date': None, 'images': {'url': None}}}}
+
+# Just enough of a playlist item to tell whether it is already in a previous snapshot of the playlist
+playlistItemFingerprintSchema = {'added_at': None, 'track': {'uri': None}}
+
+
+def page_schema(itemSchema: dict):
+    # Fields of a page of items that fetching the remaining pages relies on
+    return {'items': itemSchema, 'total': None, 'limit': None, 'offset': None}
+
+
+def render_fields(schema: dict):
+    # Renders a schema in the Web API's fields syntax, e.g. "items(added_at,track(uri)),total"
+    return ','.join(name if fields is None else f"{name}({render_fields(fields)})" for name, fields in schema.items())
+
+
+def plan_changed_items(previous: Snapshot, fingerprints: list):
+    # Returns (position in the playlist, row of the previous snapshot or None if it has to be downloaded) for every
+    # fingerprint that has a track. Both the threaded and the async client sync playlists with it
+    previousRows = dict()
+    for row in range(len(previous)):
+        key = (previous.string(previous.columns['addedAt'][row]), previous.string(previous.columns['uri'][row]))
+        previousRows.setdefault(key, deque()).append(row)
+
+    plan = []
+    for position, fingerprint in enumerate(fingerprints):
+        if fingerprint['track'] is None:
+            continue
+        rows = previousRows.get((fingerprint['added_at'], fingerprint['track']['uri']))
+        plan.append((position, rows.popleft() if rows else None))
+    return plan
+
+
+def changed_pages(plan: list, pageSize: int):
+    # Pages holding items of a plan that aren't in the previous snapshot, in playlist order
+    return sorted(set(position // pageSize for position, row in plan if row is None))
+
+
+def page_item(pageItems: list, position: int, pageSize: int):
+    # The playlist may have changed again since the fingerprints were read, then the item is gone or moved
+    item = pageItems[position % pageSize] if position % pageSize < len(pageItems) else None
+    return None if item is None or item['track'] is None else item
+
+
+def snapshot_header(playlist):
+    # Playlist details stored with its tracks. Tracks may be edited while loading, which moves the playlist on
+    # to a new snapshot id, so this is taken before loading starts
+    return {'image': playlist.image, 'id': playlist.id, 'name': playlist.name, 'owner': playlist.owner.json,
+            'snapshot_id': playlist.snapshotId}
+
+
+def saved_track_keys(tracks: list):
+    return set((track['added_at'], track['track']['uri']) for track in tracks)
+
+
+def collect_new_saved_tracks(liked: dict, known: set, newTracks: list):
+    # Adds the liked songs of a page that aren't cached yet, returns True once one that is cached shows up
+    for track in liked['items']:
+        if (track['added_at'], track['track']['uri']) in known:
+            return True
+        track['is_local'] = False  # You can't like local tracks
+        newTracks.append(track)
+    return False
+
+
 def ThrowsSpotifyException(fn):
     from functools import wraps
 
@@ -124,82 +286,193 @@ class Spotify:
              "user-follow-modify",
              "user-follow-read"]
 
+    # Number of pages fetched concurrently once the total item count is known
+    pageFetchWorkers = 8
+    # Largest page the saved tracks endpoint allows
+    savedTracksPageSize = 50
+    savedTracksCachePath = "./cache/liked"
+    playlistsPageSize = 50
+    # Largest page the playlist items endpoint allows
+    playlistPageSize = 100
+    playlistFields = render_fields({'tracks': page_schema(playlistItemSchema)})
+    playlistItemsFields = render_fields(page_schema(playlistItemSchema))
+    fingerprintFields = render_fields(page_schema(playlistItemFingerprintSchema))
+    # Most items the Web API adds to or removes from a playlist per request
+    playlistEditChunkSize = 100
+
     def __init__(self):
         super().__init__()
         self.deviceList = None
         self.__userPlaylistsFullDict = None
         self.currentDevice = None
+        self.pageFetcher = ThreadPoolExecutor(max_workers=self.pageFetchWorkers)
+        self.snapshots = SnapshotCache()
 
-        self.sp = spotipy.Spotify(
+        client = spotipy.Spotify(
             auth_manager=SpotifyOAuth(scope=' '.join(self.scope), client_id=SPOTIPY_CLIENT_ID,
                                       client_secret=SPOTIPY_CLIENT_SECRET,
-                                      redirect_uri=SPOTIPY_REDIRECT_URI))
+                                      redirect_uri=SPOTIPY_REDIRECT_URI, requests_session=session),
+            requests_session=session)
+        # All calls share one rate limit. Playback controls and edits go through self.sp and are served first,
+        # page fetches for syncing go through self.bulk and get what's left
+        self.scheduler = RequestScheduler()
+        self.sp = self.scheduler.proxy(client, interactive=True)
+        self.bulk = self.scheduler.proxy(client, interactive=False)
 
         self.user = User(self.sp.current_user())
+        self.users = {self.user.id: self.user}
+
+    def __fetch_pages(self, firstPage: dict, fetchPage):
+        # The first page reveals the total, so all remaining offsets can be requested at once.
+        # Pages are consumed in order, so items are still yielded in the order Spotify returns them
+        limit = firstPage['limit']
+        pages = [self.pageFetcher.submit(fetchPage, offset)
+                 for offset in range(firstPage['offset'] + limit, firstPage['total'], limit)]
+        try:
+            yield from firstPage['items']
+            for page in pages:
+                yield from page.result()['items']
+        finally:
+            # Don't keep downloading pages nobody is going to read
+            for page in pages:
+                page.cancel()
 
-    # TODO: Cache
     def get_user_playlists(self):
         # Use cached result if possible
         if self.__userPlaylistsFullDict is None:
-            self.__userPlaylistsFullDict = self.sp.current_user_playlists()['items']
+            playlists = self.bulk.current_user_playlists(limit=self.playlistsPageSize)
+            self.__userPlaylistsFullDict = list(self.__fetch_pages(
+                playlists, lambda offset: self.bulk.current_user_playlists(limit=playlists['limit'], offset=offset)))
         for playlist in self.__userPlaylistsFullDict:
-            yield Playlist(playlistData=playlist, owner=User(self.sp.user(playlist['owner']['id'])))
+            yield Playlist(playlistData=playlist, owner=self.owner(self.users, playlist['owner']))
 
-    def get_saved_tracks(self):
-        # Saved tracks are not cached, since they don't have a snapshot ID
-        liked = self.sp.current_user_saved_tracks()
+    @staticmethod
+    def owner(users: dict, userData: dict):
+        # Most playlists share a handful of owners, they share one User per session. The embedded owner object
+        # has everything the playlist list shows, profile pictures are looked up with load_profile
+        if userData['id'] not in users:
+            users[userData['id']] = User(userData)
+        return users[userData['id']]
 
+    @ThrowsSpotifyException
+    def load_profile(self, user: User):
+        if not user.hasProfile:
+            user.update(self.bulk.user(user.id))
+
+    def get_saved_tracks(self, fullSync=False):
+        # Saved tracks don't have a snapshot ID, so instead the cache is brought up to date by reading
+        # the newest pages until a track that's already stored shows up
+        cache = None if fullSync else self.read_saved_tracks()
+
+        liked = self.bulk.current_user_saved_tracks(limit=self.savedTracksPageSize)
+
+        if cache is not None:
+            total = liked['total']
+            known = saved_track_keys(cache)
+            newTracks = []
+            while not collect_new_saved_tracks(liked, known, newTracks) and liked['next'] is not None:
+                liked = self.bulk.next(liked)
+            tracks = self.merge_saved_tracks(total, newTracks, cache)
+            if tracks is not None:
+                for i, track in enumerate(tracks):
+                    yield PlaylistTrack(track, i + 1)
+                return
+
+        tracks = []
         i = 0
         # We have enough information to <just> not require a new class just for liked tracks
-        for track in liked['items']:
+        for track in self.__fetch_pages(liked, lambda offset: self.bulk.current_user_saved_tracks(
+                limit=liked['limit'], offset=offset)):
             i += 1
             track['is_local'] = False  # You can't like local tracks
+            tracks.append(track)
             yield PlaylistTrack(track, i)
 
-        while liked['next']:
-            for track in liked['items']:
-                i += 1
-                track['is_local'] = False  # You can't like local tracks
-                yield PlaylistTrack(track, i)
+        self.store_saved_tracks(liked['total'], tracks)
+
+    @classmethod
+    def read_saved_tracks(cls):
+        if not os.path.exists(cls.savedTracksCachePath):
+            return None
+        with open_snapshot(cls.savedTracksCachePath) as snapshot:
+            return list(snapshot.items())
+
+    @classmethod
+    def merge_saved_tracks(cls, total: int, newTracks: list, cachedTracks: list):
+        # Returns None if the totals disagree. Then something was unliked, which can't be detected from the newest pages
+        tracks = newTracks + cachedTracks
+        if len(tracks) != total:
+            return None
+        if len(newTracks) > 0:
+            cls.store_saved_tracks(total, tracks)
+        return tracks
+
+    @classmethod
+    def store_saved_tracks(cls, total: int, tracks: list):
+        os.makedirs(os.path.dirname(cls.savedTracksCachePath), exist_ok=True)
+        write_snapshot(cls.savedTracksCachePath, {'total': total}, tracks)
 
     def get_playlist_tracks(self, playlist: Playlist):
-        if not os.path.exists("./cache/playlists"):
-            os.makedirs("./cache/playlists")
-        if playlist.snapshotId in os.listdir("./cache/playlists"):
-            with open(f'./cache/playlists/{playlist.snapshotId}', 'r') as snapshotFile:
-                snapshot = json.load(snapshotFile)
+        if self.snapshots.has(playlist.id, playlist.snapshotId):
+            with self.snapshots.open(playlist.id, playlist.snapshotId) as snapshot:
                 i = 0
-                for track in snapshot['tracks']:
+                for track in snapshot.items():
                     i += 1
                     yield PlaylistTrack(track, i)
         else:
-            snapshot = dict()
-            snapshot['image'] = playlist.image
-            snapshot['id'] = playlist.id
-            snapshot['name'] = playlist.name
-            snapshot['owner'] = playlist.owner.json
-            snapshot['snapshot_id'] = playlist.snapshotId
-            snapshot['tracks'] = []
-
-            tracks = self.sp.playlist(playlist.id, fields="tracks,next")['tracks']
-            i = 0
-            for track in tracks['items']:
-                i += 1
-                snapshot['tracks'].append(track)
-                yield PlaylistTrack(track, i)
-
-            while tracks['next']:
-                tracks = self.sp.next(tracks)
-                for track in tracks['items']:
-                    # Some playlist items might not have the track property
-                    if track['track'] is None:
-                        continue
+            header = snapshot_header(playlist)
+            items = []
+
+            # A playlist that was cached before only changed since, so only the changes are downloaded
+            previous = self.snapshots.open_previous(playlist.id)
+            try:
+                if previous is None:
+                    fetchedItems = self.__fetch_playlist_items(playlist)
+                else:
+                    fetchedItems = self.__fetch_changed_playlist_items(playlist, previous)
+                i = 0
+                for track in fetchedItems:
                     i += 1
-                    snapshot['tracks'].append(track)
+                    items.append(track)
                     yield PlaylistTrack(track, i)
-
-            with open(f'./cache/playlists/{playlist.snapshotId}', 'w') as snapshotFile:
-                json.dump(snapshot, snapshotFile)
+            finally:
+                if previous is not None:
+                    previous.close()
+
+            self.snapshots.store(playlist.id, header['snapshot_id'], header, items)
+
+    def __fetch_playlist_items(self, playlist: Playlist):
+        tracks = self.bulk.playlist(playlist.id, fields=self.playlistFields)['tracks']
+        for track in self.__fetch_pages(tracks, lambda offset: self.bulk.playlist_items(
+                playlist.id, fields=self.playlistItemsFields, limit=tracks['limit'], offset=offset)):
+            # Some playlist items might not have the track property
+            if track['track'] is not None:
+                yield track
+
+    def __fetch_changed_playlist_items(self, playlist: Playlist, previous: Snapshot):
+        # Items are identified by when they were added and their track, which is all the fingerprint pages hold.
+        # Items found in the previous snapshot are reused, only pages holding the rest are downloaded in full
+        fingerprints = self.bulk.playlist_items(playlist.id, fields=self.fingerprintFields, limit=self.playlistPageSize)
+        fingerprints = list(self.__fetch_pages(fingerprints, lambda offset: self.bulk.playlist_items(
+            playlist.id, fields=self.fingerprintFields, limit=fingerprints['limit'], offset=offset)))
+
+        plan = plan_changed_items(previous, fingerprints)
+
+        pageSize = self.playlistPageSize
+        pages = {page: self.pageFetcher.submit(self.bulk.playlist_items, playlist.id, fields=self.playlistItemsFields,
+                                               limit=pageSize, offset=page * pageSize)
+                 for page in changed_pages(plan, pageSize)}
+        try:
+            for position, row in plan:
+                if row is not None:
+                    yield previous.item(row)
+                    continue
+                item = page_item(pages[position // pageSize].result()['items'], position, pageSize)
+                if item is not None:
+                    yield item
+        finally:
+            for page in pages.values():
+                page.cancel()
 
     def get_current_playback(self):
         playback = self.sp.current_playback()
@@ -208,7 +481,9 @@ class Spotify:
 
         if playback is not None:
             self.currentDevice = Device(playback['device'])
-            return Track(playback['item']), self.currentDevice, PlaybackState(shuffle=playback['shuffle_state'],
+            # Nothing is playing in between tracks and during ads
+            track = None if playback['item'] is None else Track(playback['item'])
+            return track, self.currentDevice, PlaybackState(shuffle=playback['shuffle_state'],
                                                                               playing=playback['is_playing'],
                                                                               loop=playback['repeat_state'],
                                                                               position=playback['progress_ms'])
@@ -285,18 +560,90 @@ class Spotify:
         self.sp.start_playback(context_uri=playlist.playlistUri)
 
     @ThrowsSpotifyException
-    def reorder_playlist(self, playlistId, rangeStart, insertBefore, snapshotId=None):
-        newSnapshotId = self.sp.playlist_reorder_items(playlist_id=playlistId, range_start=rangeStart,
-                                                       insert_before=insertBefore, snapshot_id=snapshotId)
-        return newSnapshotId
+    def reorder_playlist(self, playlist: Playlist, rangeStart: int, insertBefore: int, rangeLength=1):
+        snapshotId = self.sp.playlist_reorder_items(playlist_id=playlist.id, range_start=rangeStart,
+                                                    insert_before=insertBefore, range_length=rangeLength,
+                                                    snapshot_id=playlist.snapshotId)['snapshot_id']
+
+        def reorder(items):
+            movedItems = items[rangeStart:rangeStart + rangeLength]
+            del items[rangeStart:rangeStart + rangeLength]
+            position = insertBefore - rangeLength if insertBefore > rangeStart else insertBefore
+            items[position:position] = movedItems
+
+        self.__update_snapshot(playlist, snapshotId, reorder)
+        return snapshotId
 
     @ThrowsSpotifyException
-    def add_to_playlist(self, playlist: Playlist, tracks: list):
-        self.sp.playlist_add_items(playlist.id, [track.trackUri for track in tracks])
+    def add_to_playlist(self, playlist: Playlist, tracks: list, progress=None):
+        # Chunks are sent one after another, each one is appended after the previous one so the order is kept
+        # Spotify's own added_at may differ by a moment, the next delta sync then just downloads these items again
+        addedAt = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        added = []
+        try:
+            for start in range(0, len(tracks), self.playlistEditChunkSize):
+                chunk = tracks[start:start + self.playlistEditChunkSize]
+                snapshotId = self.sp.playlist_add_items(playlist.id, [track.trackUri for track in chunk])['snapshot_id']
+                added.extend(chunk)
+                if progress is not None:
+                    progress(len(added), len(tracks))
+        finally:
+            # Chunks sent before a failure are in the playlist, so the cache has to reflect them
+            if len(added) > 0:
+                self.__update_snapshot(playlist, snapshotId, lambda items: items.extend(
+                    self.__playlist_item(track, addedAt) for track in added))
 
     @ThrowsSpotifyException
-    def remove_from_playlist(self, playlist: Playlist, tracks: list):
-        self.sp.playlist_remove_specific_occurrences_of_items(playlist.id, [{"uri": playlistTrack.track.trackUri, "positions": [playlistTrack.index-1]} for playlistTrack in tracks])
+    def remove_from_playlist(self, playlist: Playlist, tracks: list, progress=None):
+        # Removing the highest positions first leaves the positions of the remaining tracks as they were,
+        # so every chunk can be sent against the snapshot the previous chunk returned
+        positions = sorted(((playlistTrack.index - 1, playlistTrack.track.trackUri) for playlistTrack in tracks),
+                           reverse=True)
+        snapshotId = playlist.snapshotId
+        removed = []
+
+        def remove(items):
+            for position, _ in removed:
+                del items[position]
+
+        try:
+            for start in range(0, len(positions), self.playlistEditChunkSize):
+                chunk = positions[start:start + self.playlistEditChunkSize]
+                snapshotId = self.sp.playlist_remove_specific_occurrences_of_items(
+                    playlist.id, [{"uri": uri, "positions": [position]} for position, uri in chunk],
+                    snapshot_id=snapshotId)['snapshot_id']
+                removed.extend(chunk)
+                if progress is not None:
+                    progress(len(removed), len(positions))
+        finally:
+            # Chunks sent before a failure are in the playlist, so the cache has to reflect them
+            if len(removed) > 0:
+                self.__update_snapshot(playlist, snapshotId, remove)
+
+    def __update_snapshot(self, playlist: Playlist, snapshotId: str, edit):
+        # The edit made through the API is applied to the cached snapshot too, and stored under the snapshot id
+        # Spotify returned, so the playlist doesn't have to be downloaded again next time it's opened
+        if self.snapshots.has(playlist.id, playlist.snapshotId):
+            with self.snapshots.open(playlist.id, playlist.snapshotId) as snapshot:
+                header = snapshot.header
+                items = list(snapshot.items())
+            edit(items)
+            header['snapshot_id'] = snapshotId
+            self.snapshots.store(playlist.id, snapshotId, header, items)
+        playlist.snapshotId = snapshotId
+
+    @staticmethod
+    def __playlist_item(track: Track, addedAt: str):
+        # The fields of playlistItemSchema, as far as a Track still has them
+        return {'added_at': addedAt,
+                'is_local': False,
+                'track': {'name': track.title,
+                          'uri': track.trackUri,
+                          'duration_ms': track.runtime,
+                          'artists': [{'name': name, 'uri': uri} for name, uri in zip(track.artists, track.artistUris)],
+                          'album': {'name': track.album,
+                                    'release_date': track.year if isinstance(track.year, str) else None,
+                                    'images': [] if track.albumCoverUri is None else [{'url': track.albumCoverUri}]}}}
 
     @ThrowsSpotifyException
     def add_new_playlist(self):
@@ -307,17 +654,187 @@ class Spotify:
         self.sp.user_playlist_unfollow(user.id, playlist.id)
 
 
-class WorkerSignals(QObject):
-    stateReady = pyqtSignal(tuple)
-
+class PlaybackPoller(QThread):
+    # Polls the playback state on its own thread, as often as the state is likely to change.
+    # Only the parts of the state that changed since the previous poll are emitted
+    trackChanged = pyqtSignal(object)
+    progressChanged = pyqtSignal(int)
+    playStateChanged = pyqtSignal(object)
+    volumeChanged = pyqtSignal(int)
+
+    # Seconds between polls. While playing the widget predicts progress itself, so polls only catch changes
+    # made elsewhere and the start of the next track
+    playingInterval = 5
+    pausedInterval = 15
+    idleInterval = 30
+    # Polls right after the user did something, so the result shows up quickly
+    actionInterval = 0.5
+    actionPolls = 3
+    # Intervals are stretched by this factor while the window is minimized
+    backgroundFactor = 4
 
-class Worker(QRunnable, QObject):
     def __init__(self, spotify: Spotify):
         super().__init__()
         self.spotify = spotify
-        self.signals = WorkerSignals()
+        self.wakeUp = threading.Event()
+        self.stopped = False
+        self.background = False
+        self.fastPolls = 0
+        self.state = (None, None, None)
 
     def run(self):
-        while True:
-            self.signals.stateReady.emit(self.spotify.get_current_playback())
-            time.sleep(1)
+        while not self.stopped:
+            try:
+                state = self.spotify.get_current_playback()
+            except SpotifyException as se:
+                if self.stopped:
+                    break
+                print(se.reason)
+                state = (None, None, None)
+            except requests.RequestException as e:
+                print(e)
+                state = (None, None, None)
+            if self.stopped:
+                break
+            self.publish(state)
+            self.wakeUp.wait(self.interval(state))
+            self.wakeUp.clear()
+
+    def publish(self, state: tuple):
+        track, device, playbackState = state
+        previousTrack, previousDevice, previousPlaybackState = self.state
+        self.state = state
+
+        trackUri = None if track is None else track.trackUri
+        if trackUri != (None if previousTrack is None else previousTrack.trackUri):
+            self.trackChanged.emit(track)
+        if device is not None and (previousDevice is None or device.volume != previousDevice.volume):
+            self.volumeChanged.emit(device.volume)
+        if playbackState is not None:
+            if previousPlaybackState is None or \
+                    (playbackState.playing, playbackState.shuffle, playbackState.loop) != \
+                    (previousPlaybackState.playing, previousPlaybackState.shuffle, previousPlaybackState.loop):
+                self.playStateChanged.emit(playbackState)
+            # Progress changes with every poll while playing, it corrects the widget's prediction
+            self.progressChanged.emit(playbackState.position)
+
+    def interval(self, state: tuple):
+        track, device, playbackState = state
+        if self.fastPolls > 0:
+            self.fastPolls -= 1
+            return self.actionInterval
+        if device is None or playbackState is None:
+            interval = self.idleInterval
+        elif playbackState.playing:
+            # Poll again shortly after the track should have ended
+            interval = self.playingInterval
+            if track is not None:
+                interval = min(interval, max(0, track.runtime - playbackState.position) / 1000 + self.actionInterval)
+        else:
+            interval = self.pausedInterval
+        if self.background:
+            interval *= self.backgroundFactor
+        return interval
+
+    def poke(self, *args):
+        # Called after user actions, polls right away and a few times after
+        self.fastPolls = self.actionPolls
+        self.wakeUp.set()
+
+    def set_background(self, background: bool):
+        self.background = background
+        if not background:
+            self.wakeUp.set()
+
+    def stop(self):
+        # Doesn't wait for the thread, a poll in progress may still have to give up on the rate limit
+        self.stopped = True
+        self.wakeUp.set()
+
+
+class TrackLoaderSignals(QObject):
+    tracksReady = pyqtSignal(list)
+    finished = pyqtSignal()
+
+
+class TrackLoader(QRunnable):
+    # Tracks are posted to the GUI thread in batches, at most once per this many seconds
+    batchInterval = 0.05
+
+    def __init__(self, tracks):
+        super().__init__()
+        self.tracks = tracks
+        self.signals = TrackLoaderSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        batch = []
+        lastBatch = time.perf_counter()
+        try:
+            for track in self.tracks:
+                if self.cancelled:
+                    return
+                batch.append(track)
+                if time.perf_counter() - lastBatch >= self.batchInterval:
+                    self.signals.tracksReady.emit(batch)
+                    batch = []
+                    lastBatch = time.perf_counter()
+            self.signals.tracksReady.emit(batch)
+        except SpotifyException as se:
+            print(se.reason)
+        # Exceptions escaping a QRunnable abort the application, a failed load only leaves the view incomplete
+        except requests.RequestException as e:
+            print(e)
+        except (ValueError, IndexError, KeyError, struct.error) as e:
+            print(f"Broken snapshot: {e}")
+        finally:
+            self.tracks.close()
+            self.signals.finished.emit()
+
+
+class UserProfileSignals(QObject):
+    loaded = pyqtSignal(User)
+
+
+class UserProfileLoader(QRunnable):
+    # Looks up the profile of a playlist owner off the GUI thread, once its playlist is opened
+    def __init__(self, spotify: Spotify, user: User):
+        super().__init__()
+        self.spotify = spotify
+        self.user = user
+        self.signals = UserProfileSignals()
+
+    def run(self):
+        try:
+            self.spotify.load_profile(self.user)
+        except requests.RequestException as e:
+            print(e)
+        finally:
+            self.signals.loaded.emit(self.user)
+
+
+class PlaylistEditSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(bool)
+
+
+class PlaylistEdit(QRunnable):
+    # Runs an edit off the GUI thread. The edit is called with a callback for reporting (done, total) progress
+    def __init__(self, edit):
+        super().__init__()
+        self.edit = edit
+        self.signals = PlaylistEditSignals()
+
+    def run(self):
+        succeeded = False
+        try:
+            # Edits report failed API calls by returning False
+            succeeded = self.edit(self.signals.progress.emit) is not False
+        except requests.RequestException as e:
+            # Writes aren't retried on connection errors, the chunks applied before it are already cached
+            print(e)
+        finally:
+            self.signals.finished.emit(succeeded)
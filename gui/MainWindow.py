@@ -1,11 +1,13 @@
+import asyncio
 import sys
 import webbrowser
 
-from PyQt5.QtCore import QTimer, Qt, QThreadPool
+from PyQt5.QtCore import Qt, QThreadPool, QEvent
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QGridLayout
+from AsyncSpotify import AsyncSpotify, AsyncTrackLoader, install_event_loop
 from PlaylistListViewWidget import PlaylistListViewWidget
-from Spotify import Spotify, Playlist, Worker
+from Spotify import Spotify, Playlist, User, PlaybackPoller, TrackLoader, PlaylistEdit, UserProfileLoader
 from gui.PlaybackToolbar import PlaybackToolbar
 from gui.PlaylistViewWidget import PlaylistViewWidget
 import resources
@@ -16,7 +18,6 @@ import resources
 # https://www.flaticon.com/free-icon/musical-note_898945?term=note&page=1&position=69&page=1&position=69&related_id=898945&origin=search
 # https://www.flaticon.com/premium-icon/love_2901197?term=heart&page=1&position=24&page=1&position=24&related_id=2901197&origin=search
 
-# TODO: Clearing old playlist cache
 # TODO: When trying to play a local track, use "position" offset instead of uri
 # TODO: Try to improve Slider handle
 # TODO: Modify track stylesheet if is playing and is in context
@@ -28,7 +29,7 @@ import resources
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, asyncBackend=False):
         super().__init__()
 
         self.setStyleSheet("* {background-color:#121212;}"
@@ -60,21 +61,26 @@ class MainWindow(QMainWindow):
         self.centralWidgetLayout.setContentsMargins(0, 0, 0, 0)
 
         self.spotify = Spotify()
-        self.stateWorker = Worker(self.spotify)
+        # Loads tracks and sends playback controls as tasks on the event loop, instead of on threads
+        self.asyncSpotify = AsyncSpotify(self.spotify) if asyncBackend else None
         self.threadPool = QThreadPool.globalInstance()
-        self.threadPool.start(self.stateWorker)
-        self.stateWorker.signals.stateReady.connect(self.set_playback_state)
-        self.trackGenerator = None
+        # Edits run one at a time and in order, each one relies on the snapshot the previous one left
+        self.editPool = QThreadPool()
+        self.editPool.setMaxThreadCount(1)
+        self.playbackPoller = PlaybackPoller(self.spotify)
+        self.trackLoader = None
         self.playlistViews = dict()
-        self.playlistGenerators = dict()
-        self.trackTimer = None
+        # Ids of playlist owners whose profile is being looked up
+        self.profileLookups = set()
 
         self.playlistListView = PlaylistListViewWidget()
-        self.playlistListView.playPlaylist.connect(self.spotify.play_playlist)
+        self.playlistListView.playPlaylist.connect(self.playback_control(self.spotify.play_playlist, 'play_playlist'))
+        self.playlistListView.playPlaylist.connect(self.playbackPoller.poke)
         for playlist in self.spotify.get_user_playlists():
             self.playlistListView.playlistList.add_item(playlist)
         self.playlistListView.selectionChanged.connect(self.change_playlist)
         self.playlistListView.openLiked.connect(self.change_playlist)
+        self.playlistListView.resyncLiked.connect(lambda playlist: self.change_playlist(playlist, fullSync=True))
         self.playlistListView.newPlaylist.connect(self.new_playlist)
         self.playlistListView.playlistList.deletePlaylist.connect(self.delete_playlist)
 
@@ -83,12 +89,20 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.create_central_widget())
 
         self.playbackToolbar = PlaybackToolbar()
-        self.playbackToolbar.widget.shuffleChanged.connect(self.spotify.sp.shuffle)
-        self.playbackToolbar.widget.previousTrack.connect(self.spotify.previous_track)
-        self.playbackToolbar.widget.playPause.connect(self.spotify.play_pause)
-        self.playbackToolbar.widget.nextTrack.connect(self.spotify.next_track)
+        self.playbackToolbar.widget.shuffleChanged.connect(self.playback_control(self.spotify.sp.shuffle, 'set_shuffle'))
+        self.playbackToolbar.widget.previousTrack.connect(self.playback_control(self.spotify.previous_track, 'previous_track'))
+        self.playbackToolbar.widget.playPause.connect(self.playback_control(self.spotify.play_pause, 'play_pause'))
+        self.playbackToolbar.widget.nextTrack.connect(self.playback_control(self.spotify.next_track, 'next_track'))
         # self.playbackToolbar.widget.loopChanged.connect(self.spotify.sp.repeat())
-        self.playbackToolbar.widget.volumeChanged.connect(self.spotify.set_volume)
+        self.playbackToolbar.widget.volumeChanged.connect(self.playback_control(self.spotify.set_volume, 'set_volume'))
+        for signal in (self.playbackToolbar.widget.shuffleChanged, self.playbackToolbar.widget.previousTrack,
+                       self.playbackToolbar.widget.playPause, self.playbackToolbar.widget.nextTrack):
+            signal.connect(self.playbackPoller.poke)
+        self.playbackPoller.trackChanged.connect(self.playbackToolbar.widget.set_track)
+        self.playbackPoller.playStateChanged.connect(self.playbackToolbar.widget.set_playback_state)
+        self.playbackPoller.progressChanged.connect(self.playbackToolbar.widget.set_position)
+        self.playbackPoller.volumeChanged.connect(self.playbackToolbar.widget.set_volume)
+        self.playbackPoller.start()
 
         self.addToolBar(Qt.BottomToolBarArea, self.playbackToolbar)
         self.setMinimumSize(1400, 800)
@@ -97,6 +111,14 @@ class MainWindow(QMainWindow):
         self.setWindowIcon(QIcon(":/icon.png"))
         self.setWindowTitle("Spotimy")
 
+    def playback_control(self, slot, coroutineName: str):
+        if self.asyncSpotify is None:
+            return slot
+        return lambda *args: asyncio.ensure_future(getattr(self.asyncSpotify, coroutineName)(*args))
+
+    def tracks_backend(self):
+        return self.spotify if self.asyncSpotify is None else self.asyncSpotify
+
     def create_central_widget(self):
         centralWidget = QWidget()
         centralWidget.setLayout(self.centralWidgetLayout)
@@ -106,11 +128,11 @@ class MainWindow(QMainWindow):
         self.centralWidgetLayout.setColumnStretch(1, 100)
         return centralWidget
 
-    def change_playlist(self, playlist: Playlist):
+    def change_playlist(self, playlist: Playlist, fullSync=False):
+        self.cancel_loading(playlist)
+
         if playlist.name == PlaylistListViewWidget.dummyPlaylist.name:
             self.playlistView.setParent(None)
-            if self.trackTimer is not None:
-                self.trackTimer.stop()
             self.playlistView = PlaylistViewWidget(PlaylistListViewWidget.dummyPlaylist)
             self.playlistView.setParent(self)
             self.centralWidgetLayout.addWidget(self.playlistView, 0, 1)
@@ -118,7 +140,7 @@ class MainWindow(QMainWindow):
 
         if playlist.name == "Liked songs":
             playlist.owner = self.spotify.get_current_user()
-            self.playlistViews[playlist.name] = (PlaylistViewWidget(playlist), self.spotify.get_saved_tracks())
+            self.playlistViews[playlist.name] = self.load_playlist_view(playlist, self.tracks_backend().get_saved_tracks(fullSync))
             self.playlistViews[playlist.name][0].trackList.update_playlist_list(self.playlistListView.playlistList.playlists)
             self.playlistViews[playlist.name][0].trackList.addToPlaylist.connect(self.add_to_playlist)
             self.playlistListView.likedSongsButton.selected()
@@ -126,10 +148,10 @@ class MainWindow(QMainWindow):
             self.playlistListView.likedSongsButton.deselected()
 
         if playlist.name not in self.playlistViews.keys():
-            self.playlistViews[playlist.name] = (PlaylistViewWidget(playlist), self.spotify.get_playlist_tracks(playlist))
+            self.playlistViews[playlist.name] = self.load_playlist_view(playlist, self.tracks_backend().get_playlist_tracks(playlist))
             self.playlistViews[playlist.name][0].trackList.update_playlist_list(self.playlistListView.playlistList.playlists)
             self.playlistViews[playlist.name][0].trackList.addToPlaylist.connect(self.add_to_playlist)
-            self.playlistViews[playlist.name][0].removeFromPlaylist.connect(self.spotify.remove_from_playlist)
+            self.playlistViews[playlist.name][0].removeFromPlaylist.connect(self.remove_from_playlist)
 
         try:
             self.playlistView.trackList.orderChanged.disconnect(self.update_order)
@@ -140,40 +162,74 @@ class MainWindow(QMainWindow):
             self.playlistView.setParent(None)
         except RuntimeError:
             pass
-        self.playlistView, self.trackGenerator = self.playlistViews[playlist.name]
+        self.playlistView, _ = self.playlistViews[playlist.name]
         self.playlistView.setParent(self)
+        self.load_owner_profile(self.playlistView.playlist.owner)
         self.playlistView.trackList.orderChanged.connect(self.update_order)
         self.playlistView.playTrack.connect(self.play_track)
         self.centralWidgetLayout.addWidget(self.playlistView, 0, 1)
 
-        self.trackTimer = QTimer().singleShot(0, self.populate_playlist_view)
+    def load_playlist_view(self, playlist: Playlist, tracks):
+        # Tracks are fetched on the thread pool or as a task, so the GUI thread never waits for Spotify
+        playlistView = PlaylistViewWidget(playlist)
+        loader = TrackLoader(tracks) if self.asyncSpotify is None else AsyncTrackLoader(tracks)
+        loader.signals.tracksReady.connect(playlistView.add_tracks)
+        loader.signals.finished.connect(lambda: self.loading_finished(loader))
+        self.trackLoader = (playlist.name, loader)
+        if self.asyncSpotify is None:
+            self.threadPool.start(loader)
+        else:
+            loader.start()
+        return playlistView, loader
 
-    def populate_playlist_view(self):
-        try:
-            track = next(self.trackGenerator)
-        except StopIteration:
-            return
-        except TypeError:
-            self.trackTimer = QTimer().singleShot(0, self.populate_playlist_view)
+    def load_owner_profile(self, owner: User):
+        # Only the header of an open playlist shows its owner's picture, which the playlist list doesn't include
+        if owner.hasProfile or owner.id in self.profileLookups:
             return
+        self.profileLookups.add(owner.id)
+        if self.asyncSpotify is None:
+            loader = UserProfileLoader(self.spotify, owner)
+            loader.signals.loaded.connect(self.profile_loaded)
+            self.threadPool.start(loader)
+        else:
+            task = asyncio.ensure_future(self.asyncSpotify.load_profile(owner))
+            task.add_done_callback(lambda task: self.profile_loaded(owner))
+
+    def profile_loaded(self, owner: User):
+        self.profileLookups.discard(owner.id)
+        for playlistView, _ in self.playlistViews.values():
+            if playlistView.playlist.owner is owner:
+                playlistView.set_owner_picture()
 
-        self.playlistView.add_track(track)
-        self.trackTimer = QTimer().singleShot(0, self.populate_playlist_view)
+    def loading_finished(self, loader):
+        if self.trackLoader is not None and self.trackLoader[1] is loader:
+            self.trackLoader = None
+
+    def cancel_loading(self, playlist: Playlist):
+        if self.trackLoader is None:
+            return
+        name, loader = self.trackLoader
+        # Opening the same playlist again shouldn't restart loading it, unless it's liked songs which are always reloaded
+        if name == playlist.name and name != "Liked songs":
+            return
+        # Partially loaded views are dropped, so they are loaded from scratch when opened again
+        loader.cancel()
+        self.trackLoader = None
+        if name in self.playlistViews.keys() and self.playlistViews[name][1] is loader:
+            self.playlistViews.pop(name)[0].deleteLater()
 
     def update_order(self, x, y):
-        self.spotify.reorder_playlist(self.playlistView.playlist.id, x, y)
+        playlist = self.playlistView.playlist
+        self.edit_playlist(None, lambda progress: self.spotify.reorder_playlist(playlist, x, y))
 
     def play_track(self, context, track):
-        if not self.spotify.play_track(context, track):
-            webbrowser.open(track)
-
-    def set_playback_state(self, states: tuple):
-        if states[1] is not None and not states[1].isPrivateSession:
-            self.playbackToolbar.widget.set_track(states[0])
-            self.playbackToolbar.widget.set_device(states[1])
-            self.playbackToolbar.widget.set_playback_state(states[2])
+        if self.asyncSpotify is None:
+            if not self.spotify.play_track(context, track):
+                webbrowser.open(track)
         else:
-            self.playbackToolbar.widget.set_device(states[1])
+            task = asyncio.ensure_future(self.asyncSpotify.play_track(context, track))
+            task.add_done_callback(lambda task: task.cancelled() or task.result() or webbrowser.open(track))
+        self.playbackPoller.poke()
 
     def new_playlist(self):
         # Add item at index 0, same as Spotify does
@@ -188,10 +244,49 @@ class MainWindow(QMainWindow):
         self.playlistViews.pop(playlist.name)
 
     def add_to_playlist(self, playlist: Playlist, items: list):
-        self.spotify.add_to_playlist(playlist, items)
-
-
+        self.edit_playlist(f"Adding tracks to {playlist.name}",
+                           lambda progress: self.spotify.add_to_playlist(playlist, items, progress))
+
+    def remove_from_playlist(self, playlist: Playlist, tracks: list):
+        self.edit_playlist(f"Removing tracks from {playlist.name}",
+                           lambda progress: self.spotify.remove_from_playlist(playlist, tracks, progress))
+
+    def edit_playlist(self, description, edit):
+        # Large edits take a few seconds, their progress is shown in the status bar
+        job = PlaylistEdit(edit)
+        if description is not None:
+            job.signals.progress.connect(
+                lambda done, total: self.statusBar().showMessage(f"{description}: {done}/{total}"))
+            job.signals.finished.connect(
+                lambda succeeded: self.statusBar().showMessage(f"{description}: {'done' if succeeded else 'failed'}",
+                                                               5000))
+        self.editPool.start(job)
+
+    def changeEvent(self, e) -> None:
+        super().changeEvent(e)
+        if e.type() == QEvent.WindowStateChange:
+            self.playbackPoller.set_background(self.isMinimized())
+
+    def closeEvent(self, e) -> None:
+        self.shutdown()
+        super().closeEvent(e)
+
+    def shutdown(self):
+        # Edits still queued would leave playlists half edited
+        self.editPool.waitForDone()
+        if self.trackLoader is not None:
+            self.trackLoader[1].cancel()
+        self.playbackPoller.stop()
+        # Calls still waiting for the rate limit give up instead of holding up quitting
+        self.spotify.scheduler.close()
+        self.playbackPoller.wait()
+
+
+# python ./MainWindow.py --async uses the asyncio backend, which needs httpx and qasync
+useAsync = "--async" in sys.argv
 app = QApplication(sys.argv)
+# The async backend runs its tasks on the Qt event loop
+loop = install_event_loop(app) if useAsync else None
 
 try:
     import qdarkstyle
@@ -200,10 +295,18 @@ try:
 except ImportError as e:
     pass
 # Create the parent Widget of the Widgets added to the layout
-window = MainWindow()
+window = MainWindow(asyncBackend=useAsync)
+# Shut down even if the application quits without the window being closed
+app.aboutToQuit.connect(window.shutdown)
 
 # Show the parent Widget
 window.show()
 
 # Launch the application
-sys.exit(app.exec())
+if loop is None:
+    sys.exit(app.exec())
+with loop:
+    exitCode = loop.run_forever()
+    # shutdown runs as the loop stops and can't wait for coroutines, so the async client is closed once it has
+    loop.run_until_complete(window.asyncSpotify.close())
+sys.exit(exitCode)
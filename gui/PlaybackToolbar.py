@@ -1,9 +1,11 @@
-from PyQt5.QtCore import Qt, pyqtSignal, QEvent
+import time
+
+from PyQt5.QtCore import Qt, pyqtSignal, QEvent, QTimer, QSignalBlocker
 from PyQt5.QtGui import QPixmap, QIcon, QMouseEvent, QFont
 from PyQt5.QtWidgets import QToolBar, QHBoxLayout, QPushButton, QWidget, QLabel, QVBoxLayout, QSlider
 
 import CachingImageGetter
-from Spotify import Track, PlaybackState, Device
+from Spotify import Track, PlaybackState
 
 
 # TODO: Color buttons when hovered
@@ -58,6 +60,8 @@ class PlaybackWidget(QWidget):
 
     iconSize = 12
     albumCoverSize = 80
+    # Milliseconds between updates of the predicted track progress
+    progressInterval = 250
 
     def __init__(self):
         super().__init__()
@@ -100,6 +104,13 @@ class PlaybackWidget(QWidget):
 
         self.runtimeLabel = QLabel("0:00")
 
+        # Progress is only polled every few seconds, in between it's predicted from the last known position
+        self.position = 0
+        self.positionTime = time.monotonic()
+        self.progressTimer = QTimer(self)
+        self.progressTimer.setInterval(self.progressInterval)
+        self.progressTimer.timeout.connect(self.predict_progress)
+
         self.queueButton = ToolbarButton(":/queue.png", self.iconSize, self.iconSize)
         self.devicesButton = ToolbarButton(":/connect.png", self.iconSize, self.iconSize)
 
@@ -116,6 +127,8 @@ class PlaybackWidget(QWidget):
 
         self.maximizeButton = ToolbarButton(":/maximize.png", self.iconSize, self.iconSize)
 
+        CachingImageGetter.imageLoader.imageReady.connect(self.image_ready)
+
         layout = QHBoxLayout()
 
         layout.setSpacing(0)
@@ -175,7 +188,7 @@ class PlaybackWidget(QWidget):
             return
 
         self.track = track
-        self.trackCoverLabel.setPixmap(CachingImageGetter.get_image(track.albumCoverUri).scaled(self.albumCoverSize, self.albumCoverSize, transformMode=Qt.SmoothTransformation))
+        self.trackCoverLabel.setPixmap(CachingImageGetter.request_scaled_image(track.albumCoverUri, self.albumCoverSize, ':/track_placeholder.png'))
         self.titleLabel.setText(track.title)
         self.artistsLabel.setText(", ".join(track.artists))
         time = track.runtime / 1000
@@ -189,6 +202,10 @@ class PlaybackWidget(QWidget):
         self.artistsLabel.setFixedWidth(
             self.maximizeButton.width() + self.volumeSlider.width() + self.volumeButton.width() + self.devicesButton.width() + self.queueButton.width() - self.trackCoverLabel.width())
 
+    def image_ready(self, uri: str):
+        if self.track is not None and uri == self.track.albumCoverUri:
+            self.trackCoverLabel.setPixmap(CachingImageGetter.request_scaled_image(uri, self.albumCoverSize, ':/track_placeholder.png'))
+
     def set_playback_state(self, playbackState: PlaybackState):
 
         if playbackState is None:
@@ -197,22 +214,38 @@ class PlaybackWidget(QWidget):
         # set shuffle
 
         # Set playing status
+        self.statePlaying = playbackState.playing
         if playbackState.playing:
             self.playPauseButton.change_pixmap(":/pause.png")
+            self.progressTimer.start()
         else:
             self.playPauseButton.change_pixmap(":/play.png")
+            self.progressTimer.stop()
 
-        # Set timing info
-        time = playbackState.position / 1000
-        minutes = int(time / 60)
-        seconds = int(time - 60 * minutes)
-        self.timeLabel.setText(f"{minutes:02d}:{seconds:02d}")
-        self.trackSlider.setValue(playbackState.position)
         # set loop
 
-    def set_device(self, device: Device):
-        if device is not None:
-            self.volumeSlider.setValue(device.volume)
+    def set_position(self, position: int):
+        self.position = position
+        self.positionTime = time.monotonic()
+        self.set_progress(position)
+
+    def predict_progress(self):
+        position = self.position + int((time.monotonic() - self.positionTime) * 1000)
+        if self.track is not None:
+            position = min(position, self.track.runtime)
+        self.set_progress(position)
+
+    def set_progress(self, position: int):
+        seconds = position // 1000
+        self.timeLabel.setText(f"{seconds // 60:02d}:{seconds % 60:02d}")
+        if not self.trackSlider.isSliderDown():
+            self.trackSlider.setValue(position)
+
+    def set_volume(self, volume: int):
+        # Volume changed elsewhere, so it must not be sent back to Spotify
+        with QSignalBlocker(self.volumeSlider):
+            self.volumeSlider.setValue(volume)
+        self.update_volume_icon(volume)
 
     def shuffle_pushed(self):
         self.shuffleState = not self.shuffleState
@@ -236,6 +269,10 @@ class PlaybackWidget(QWidget):
 
     def change_volume(self):
         value = self.volumeSlider.value()
+        self.update_volume_icon(value)
+        self.volumeChanged.emit(value)
+
+    def update_volume_icon(self, value: int):
         if value == 0:
             self.volumeButton.change_pixmap(":/sound_mute.png")
         elif value <= 30:
@@ -245,8 +282,6 @@ class PlaybackWidget(QWidget):
         else:
             self.volumeButton.change_pixmap(":/sound_loud.png")
 
-        self.volumeChanged.emit(value)
-
 
 class PlaybackToolbar(QToolBar):
     def __init__(self):
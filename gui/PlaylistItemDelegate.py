@@ -0,0 +1,113 @@
+import datetime
+from PyQt5.QtCore import Qt, QRect, QSize, QModelIndex
+from PyQt5.QtGui import QFont, QColor, QPainter, QFontMetrics
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QStyle
+
+from CachingImageGetter import request_scaled_image
+from Spotify import PlaylistTrack
+from gui.TrackListModel import TrackListModel
+
+
+# TODO: Animate index when track is playing, color title green
+
+
+def format_added_at(addedAt: str):
+    time = datetime.datetime.strptime(addedAt, "%Y-%m-%dT%H:%M:%SZ")
+    delta = datetime.datetime.now() - time
+
+    # Format date the same way Spotify does
+    if delta.days > 31:
+        return time.strftime("%d %b %Y")
+    elif delta.days > 0:
+        return f"{delta.days} days ago"
+    elif int(delta.seconds / 3600) > 0:
+        return f"{int(delta.seconds / 3600)} hours ago"
+    elif int(delta.seconds / 60) > 0:
+        return f"{int(delta.seconds / 60)} minutes ago"
+    else:
+        return f"{delta.seconds} seconds ago"
+
+
+def format_runtime(runtime: int):
+    time = runtime / 1000
+    minutes = int(time / 60)
+    seconds = int(time - 60 * minutes)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+# Paints a track row directly, so no widgets have to be created for every track
+class PlaylistItemDelegate(QStyledItemDelegate):
+
+    selectedColor = QColor("#5A5A5A")
+    titleColor = QColor("#FFFFFF")
+    textColor = QColor("#A8A8A8")
+    albumCoverSize = 40
+    rowHeight = 60
+    margin = 11
+    spacing = 6
+
+    indexWidth = 25
+    albumWidth = 400
+    addedWidth = 350
+    runtimeWidth = 60
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.titleFont = QFont("Gotham Book", 9, QFont.Bold)
+        self.artistsFont = QFont("Gotham Book", 9, QFont.Normal)
+
+    def cover(self, uri: str):
+        # Only rows being painted ask for their covers, so visible rows are the ones that get downloaded
+        return request_scaled_image(uri, self.albumCoverSize, ':/track_placeholder.png')
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        return QSize(option.rect.width(), self.rowHeight)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex) -> None:
+        playlistTrack: PlaylistTrack = index.data(TrackListModel.PlaylistTrackRole)
+        track = playlistTrack.track
+
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, self.selectedColor)
+
+        rect = option.rect.adjusted(self.margin, 0, -self.margin, 0)
+        top = rect.top()
+        height = rect.height()
+        x = rect.left()
+
+        painter.setFont(option.font)
+        painter.setPen(self.textColor)
+        painter.drawText(QRect(x, top, self.indexWidth, height), Qt.AlignCenter, str(playlistTrack.index))
+        x += self.indexWidth + self.spacing
+
+        painter.drawPixmap(x, top + (height - self.albumCoverSize) // 2, self.cover(track.albumCoverUri))
+        x += self.albumCoverSize + self.spacing
+
+        # Fixed width columns are laid out from the right edge, the title column takes what's left
+        right = rect.right()
+        runtimeRect = QRect(right - self.runtimeWidth, top, self.runtimeWidth, height)
+        right -= self.runtimeWidth + self.spacing
+        addedRect = QRect(right - self.addedWidth, top, self.addedWidth, height)
+        right -= self.addedWidth + self.spacing
+        albumRect = QRect(right - self.albumWidth, top, self.albumWidth, height)
+        right -= self.albumWidth + self.spacing
+        titleWidth = max(0, right - x)
+
+        self.draw_elided(painter, QRect(x, top, titleWidth, height // 2), Qt.AlignLeft | Qt.AlignBottom,
+                         track.title, self.titleFont, self.titleColor)
+        self.draw_elided(painter, QRect(x, top + height // 2, titleWidth, height // 2), Qt.AlignLeft | Qt.AlignTop,
+                         ', '.join(track.artists), self.artistsFont, self.textColor)
+
+        self.draw_elided(painter, albumRect, Qt.AlignLeft | Qt.AlignVCenter, track.album, option.font, self.textColor)
+        self.draw_elided(painter, addedRect, Qt.AlignLeft | Qt.AlignVCenter, format_added_at(playlistTrack.addedAt),
+                         option.font, self.textColor)
+        self.draw_elided(painter, runtimeRect, Qt.AlignLeft | Qt.AlignVCenter, format_runtime(track.runtime),
+                         option.font, self.textColor)
+        painter.restore()
+
+    @staticmethod
+    def draw_elided(painter: QPainter, rect: QRect, alignment, text: str, font: QFont, color: QColor):
+        painter.setFont(font)
+        painter.setPen(color)
+        painter.drawText(rect, alignment, QFontMetrics(font).elidedText(text, Qt.ElideRight, rect.width()))
@@ -1,8 +1,8 @@
 from PyQt5.QtCore import Qt, QEvent, pyqtSignal
-from PyQt5.QtGui import QPixmap, QFont, QMouseEvent
+from PyQt5.QtGui import QFont, QMouseEvent
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLabel
 
-from CachingImageGetter import get_image
+from CachingImageGetter import request_scaled_image, imageLoader
 from Spotify import Playlist
 
 
@@ -19,10 +19,8 @@ class PlaylistListItemWidget(QWidget):
         self.playlist = playlist
 
         self.imageLabel = QLabel()
-        if playlist.image is not None:
-            self.imageLabel.setPixmap(get_image(playlist.image).scaled(45, 45, transformMode=Qt.SmoothTransformation))
-        else:
-            self.imageLabel.setPixmap(QPixmap(':/playlist_placeholder.png').scaled(45, 45, transformMode=Qt.SmoothTransformation))
+        self.imageLabel.setPixmap(request_scaled_image(playlist.image, 45, ':/playlist_placeholder.png'))
+        imageLoader.imageReady.connect(self.image_ready)
         self.nameLabel = QLabel(playlist.name)
         self.nameLabel.setFont(QFont("ComicSans", 10, QFont.Bold))
 
@@ -35,6 +33,10 @@ class PlaylistListItemWidget(QWidget):
 
         self.setFixedWidth(250)
 
+    def image_ready(self, uri: str):
+        if uri == self.playlist.image:
+            self.imageLabel.setPixmap(request_scaled_image(uri, 45, ':/playlist_placeholder.png'))
+
     def event(self, event):
         if not self.isSelected:
             if event.type() == QEvent.HoverEnter:
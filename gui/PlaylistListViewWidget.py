@@ -84,6 +84,7 @@ class PlaylistListViewWidget(QWidget):
     COLUMN_WIDTH = 250
     selectionChanged = pyqtSignal(Playlist)
     openLiked = pyqtSignal(Playlist)
+    resyncLiked = pyqtSignal(Playlist)
     playPlaylist = pyqtSignal(Playlist)
     newPlaylist = pyqtSignal()
 
@@ -117,6 +118,8 @@ class PlaylistListViewWidget(QWidget):
         self.likedSongsButton = LabeledIconButton("Liked songs", ":/playlist_liked.png")
         self.likedSongsButton.clicked.connect(self.open_liked)
         self.likedSongsButton.setFixedWidth(self.COLUMN_WIDTH)
+        self.likedSongsButton.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.likedSongsButton.customContextMenuRequested.connect(self.open_liked_menu)
         layout.addWidget(self.likedSongsButton, alignment=Qt.AlignLeft)
 
         frame = QFrame()
@@ -148,6 +151,19 @@ class PlaylistListViewWidget(QWidget):
         self.newPlaylist.emit()
 
     def open_liked(self):
+        self.openLiked.emit(self.select_liked())
+
+    def open_liked_menu(self, point: QPoint):
+        menu = QMenu()
+
+        resync = QAction("Resync liked songs", self)
+        resync.triggered.connect(lambda: self.resyncLiked.emit(self.select_liked()))
+
+        menu.addAction(resync)
+
+        menu.exec_(self.likedSongsButton.mapToGlobal(point))
+
+    def select_liked(self):
         self.playlistList.itemSelectionChanged.disconnect(self.selection_changed)
         if self.previousSelection is not None:
             try:
@@ -158,5 +174,5 @@ class PlaylistListViewWidget(QWidget):
         playlist = copy.copy(self.dummyPlaylist)
         playlist.image = ":/playlist_liked.png"
         playlist.name = "Liked songs"
-        self.openLiked.emit(playlist)
-        self.playlistList.itemSelectionChanged.connect(self.selection_changed)
\ No newline at end of file
+        self.playlistList.itemSelectionChanged.connect(self.selection_changed)
+        return playlist
@@ -2,12 +2,10 @@
 
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QPixmap, QFont, QImage, QBitmap
-from PyQt5.QtWidgets import QVBoxLayout, QWidget, QHBoxLayout, QLabel, QListWidgetItem, QSplitter
+from PyQt5.QtWidgets import QVBoxLayout, QWidget, QHBoxLayout, QLabel, QSplitter
 
-import CachingImageGetter
-from CachingImageGetter import get_image
+from CachingImageGetter import request_scaled_image, imageLoader
 from Spotify import Playlist
-from gui.PlaylistItemWidget import PlaylistItemWidget
 from gui.TrackListWidget import TrackListWidget
 import resources
 
@@ -24,17 +22,12 @@ class PlaylistViewWidget(QWidget):
         super().__init__()
         self.playlist = playlist
         self.totalRuntime = 0
-        self.previousSelection = set()
 
         self.mainLayout = QVBoxLayout()
 
         self.coverLabel = QLabel()
         self.coverLabel.setStyleSheet("background: #282828;")
-        if playlist.image is not None:
-            self.coverLabel.setPixmap(get_image(playlist.image).scaled(192, 192, transformMode=Qt.SmoothTransformation))
-        else:
-            self.coverLabel.setPixmap(
-                QPixmap(':/playlist_placeholder.png').scaled(192, 192, transformMode=Qt.SmoothTransformation))
+        self.set_cover()
         # Font: Vision - Free Font Family
         self.nameLabel = QLabel(playlist.name)
         self.nameLabel.setFont(QFont('Gotham', 36, QFont.Black))
@@ -42,14 +35,8 @@ class PlaylistViewWidget(QWidget):
 
         self.ownerPictureLabel = QLabel()
         self.ownerPictureLabel.setFixedHeight(40)
-        if playlist.owner.image is not None:
-            picture = CachingImageGetter.get_image(playlist.owner.image).scaled(512, 512,
-                                                                                transformMode=Qt.SmoothTransformation)
-        else:
-            picture = QPixmap(':/pfp_placeholder.png').scaled(512, 512)
-        mask = QImage(':/pfp_mask.png').createAlphaMask()
-        picture.setMask(QBitmap.fromImage(mask))
-        self.ownerPictureLabel.setPixmap(picture.scaled(30, 30, transformMode=Qt.SmoothTransformation))
+        self.set_owner_picture()
+        imageLoader.imageReady.connect(self.image_ready)
 
         self.infoLabel = QLabel()
         self.infoLabel.setFont(QFont('Gotham', 12, QFont.Normal))
@@ -58,6 +45,9 @@ class PlaylistViewWidget(QWidget):
 
         self.trackList = TrackListWidget()
         self.trackList.removeFromPlaylist.connect(self.remove_from_playlist)
+        # Tracks are removed from the model after removeFromPlaylist, so the count is only right once they're gone
+        self.trackList.trackModel.rowsRemoved.connect(lambda parent, first, last: self.update_info())
+        self.trackList.playTrack.connect(lambda trackUri: self.playTrack.emit(self.playlist.playlistUri, trackUri))
 
         headerLayout = QHBoxLayout()
         headerLayout.addWidget(self.coverLabel, alignment=Qt.AlignBottom)
@@ -82,30 +72,41 @@ class PlaylistViewWidget(QWidget):
         self.setLayout(self.mainLayout)
         self.setMinimumSize(500, 500)
 
-        self.trackList.itemSelectionChanged.connect(self.list_selection_changed)
         # Override default stylesheet to show selected items
         self.trackList.setStyleSheet(
             "QListView::item:selected:active {background-color:#5A5A5A;} QListView::item:selected:!active {background-color:#5A5A5A;} QListView::item:hover:!selected {background-color:#121212;}")
 
-    def add_track(self, playlistTrack):
-        self.totalRuntime += playlistTrack.track.runtime
-        itemWidget = PlaylistItemWidget(playlistTrack)
-        itemWidget.playTrack.connect(lambda trackUri: self.playTrack.emit(self.playlist.playlistUri, trackUri))
-        self.trackList.add_widget(itemWidget)
+    def set_cover(self):
+        self.coverLabel.setPixmap(request_scaled_image(self.playlist.image, 192, ':/playlist_placeholder.png'))
+
+    def set_owner_picture(self):
+        # Copied, so masking doesn't modify the cached pixmap
+        picture = QPixmap(request_scaled_image(self.playlist.owner.image, 512, ':/pfp_placeholder.png'))
+        mask = QImage(':/pfp_mask.png').createAlphaMask()
+        picture.setMask(QBitmap.fromImage(mask))
+        self.ownerPictureLabel.setPixmap(picture.scaled(30, 30, transformMode=Qt.SmoothTransformation))
+
+    def image_ready(self, uri: str):
+        if uri == self.playlist.image:
+            self.set_cover()
+        if uri == self.playlist.owner.image:
+            self.set_owner_picture()
+
+    def add_tracks(self, playlistTracks: list):
+        if len(playlistTracks) == 0:
+            return
+        self.totalRuntime += self.runtime(playlistTracks)
+        self.trackList.add_tracks(playlistTracks)
+        self.update_info()
+
+    @staticmethod
+    def runtime(playlistTracks: list):
+        return sum(playlistTrack.track.runtime for playlistTrack in playlistTracks)
+
+    def update_info(self):
         self.infoLabel.setText(
             f"{self.playlist.owner.name} ▴ {len(self.trackList)} tracks ▴ {int(self.totalRuntime / 3600000)}h {int(self.totalRuntime / 60000 - 60 * int(self.totalRuntime / 3600000))}m")
 
     def remove_from_playlist(self, tracks_to_remove: list):
+        self.totalRuntime -= self.runtime(tracks_to_remove)
         self.removeFromPlaylist.emit(self.playlist, tracks_to_remove)
-
-    def list_selection_changed(self):
-        selectedWidgets = set([self.trackList.itemWidget(item) for item in self.trackList.selectedItems()])
-        newSelection = selectedWidgets - self.previousSelection
-        deselected = self.previousSelection - selectedWidgets
-
-        self.previousSelection = selectedWidgets
-
-        for widget in newSelection:
-            widget.selected()
-        for widget in deselected:
-            widget.deselected()
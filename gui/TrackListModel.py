@@ -0,0 +1,77 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from Spotify import PlaylistTrack
+
+
+class TrackListModel(QAbstractListModel):
+
+    PlaylistTrackRole = Qt.UserRole
+
+    def __init__(self):
+        super().__init__()
+        self.tracks = []
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.tracks)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        playlistTrack: PlaylistTrack = self.tracks[index.row()]
+        if role == Qt.DisplayRole:
+            return playlistTrack.track.title
+        if role == self.PlaylistTrackRole:
+            return playlistTrack
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if index.isValid():
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+        # Tracks can only be dropped in between other tracks, not onto them
+        return Qt.ItemIsDropEnabled
+
+    def supportedDropActions(self) -> Qt.DropActions:
+        return Qt.MoveAction
+
+    def add_tracks(self, playlistTracks: list):
+        if len(playlistTracks) == 0:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.tracks), len(self.tracks) + len(playlistTracks) - 1)
+        self.tracks.extend(playlistTracks)
+        self.endInsertRows()
+
+    def moveRows(self, sourceParent: QModelIndex, sourceRow: int, count: int, destinationParent: QModelIndex,
+                 destinationChild: int) -> bool:
+        # Moving a range onto itself or right behind itself is a no-op, which beginMoveRows refuses
+        if sourceRow <= destinationChild <= sourceRow + count:
+            return False
+        if not self.beginMoveRows(sourceParent, sourceRow, sourceRow + count - 1, destinationParent,
+                                  destinationChild):
+            return False
+        movedTracks = self.tracks[sourceRow:sourceRow + count]
+        del self.tracks[sourceRow:sourceRow + count]
+        if destinationChild > sourceRow:
+            destinationChild -= count
+        self.tracks[destinationChild:destinationChild] = movedTracks
+        self.endMoveRows()
+        return True
+
+    def removeRows(self, row: int, count: int, parent: QModelIndex = QModelIndex()) -> bool:
+        if row < 0 or count <= 0 or row + count > len(self.tracks):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.tracks[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def update_indexes(self):
+        # Removing tracks from Spotify relies on indexes matching positions in the playlist
+        for idx, playlistTrack in enumerate(self.tracks):
+            playlistTrack.index = idx + 1
+        if len(self.tracks) > 0:
+            self.dataChanged.emit(self.index(0), self.index(len(self.tracks) - 1))
@@ -1,29 +1,49 @@
 import webbrowser
 from typing import Union
 
-from PyQt5.QtCore import pyqtSignal, Qt, QPoint, QModelIndex
-from PyQt5.QtGui import QDrag, QKeySequence
-from PyQt5.QtWidgets import QListWidget, QAbstractItemView, QMenu, QAction, QActionGroup, QListWidgetItem, QShortcut
+from PyQt5.QtCore import pyqtSignal, Qt, QPoint, QModelIndex, QPersistentModelIndex
+from PyQt5.QtGui import QDrag, QKeySequence, QDropEvent
+from PyQt5.QtWidgets import QListView, QAbstractItemView, QMenu, QAction, QActionGroup, QShortcut
 
+from CachingImageGetter import imageLoader, prefetch_scaled_image, release_scaled_image
 from Spotify import Playlist
+from gui.PlaylistItemDelegate import PlaylistItemDelegate
+from gui.TrackListModel import TrackListModel
 
 
-class TrackListWidget(QListWidget):
+class TrackListWidget(QListView):
+
+    # Rows above and below the visible ones whose covers are loaded ahead of scrolling
+    coverPrefetchRows = 50
 
     orderChanged = pyqtSignal(int, int)
     addToPlaylist = pyqtSignal(Playlist, list)
     removeFromPlaylist = pyqtSignal(list)
+    playTrack = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
 
         self.playlistList = []
 
+        self.trackModel = TrackListModel()
+        self.setModel(self.trackModel)
+        self.setItemDelegate(PlaylistItemDelegate(self))
+        # All rows have the same height, so the view doesn't have to ask the delegate for every row
+        self.setUniformItemSizes(True)
+
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.open_menu)
-        self.model().rowsMoved.connect(self.update_indexes)
+        self.trackModel.rowsMoved.connect(self.update_indexes)
+        self.doubleClicked.connect(self.play_track)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setDragDropMode(QAbstractItemView.InternalMove)
+        # Covers are painted with a placeholder until they are downloaded
+        imageLoader.imageReady.connect(self.image_ready)
+        # Rows whose covers are currently loaded, as a range
+        self.coverRows = range(0)
+        self.verticalScrollBar().valueChanged.connect(self.update_cover_rows)
+        self.trackModel.rowsInserted.connect(self.update_cover_rows)
 
         self.shortcut = QShortcut(QKeySequence("Delete"), self)
         self.shortcut.activated.connect(self.remove_from_playlist)
@@ -34,6 +54,30 @@ class TrackListWidget(QListWidget):
         drag.setMimeData(self.model().mimeData(indexes))
         drag.exec(supportedActions)
 
+    def dropEvent(self, event: QDropEvent) -> None:
+        if event.source() is not self:
+            event.ignore()
+            return
+
+        index = self.indexAt(event.pos())
+        if not index.isValid():
+            row = len(self.trackModel)
+        elif self.dropIndicatorPosition() == QAbstractItemView.BelowItem:
+            row = index.row() + 1
+        else:
+            row = index.row()
+
+        # Rows are moved one at a time, so every move maps to a single reorder call
+        for persistentIndex in [QPersistentModelIndex(idx) for idx in sorted(self.selectedIndexes())]:
+            self.trackModel.moveRow(QModelIndex(), persistentIndex.row(), QModelIndex(), row)
+            # Dropped tracks end up next to each other, in the order they were in before
+            row = persistentIndex.row() + 1
+        event.accept()
+
+        self.stopAutoScroll()
+        self.setState(QAbstractItemView.NoState)
+        self.viewport().update()
+
     def open_menu(self, point: QPoint):
         menu = QMenu()
 
@@ -59,7 +103,7 @@ class TrackListWidget(QListWidget):
 
         # If a single song was selected, add more options
         if len(self.selectedIndexes()) == 1:
-            track = self.itemWidget(self.selectedItems()[0]).playlistTrack.track
+            track = self.selected_tracks()[0].track
             menu.addSeparator()
             openInSpotify = QAction("Open in Spotify", self)
             openInSpotify.triggered.connect(
@@ -85,75 +129,94 @@ class TrackListWidget(QListWidget):
 
         menu.exec_(self.mapToGlobal(point))
 
+    def selected_tracks(self):
+        return [self.trackModel.tracks[idx.row()] for idx in sorted(self.selectedIndexes())]
+
     def move_to_top(self):
-        selection = sorted(self.selectedIndexes(), reverse=True)
-        # We can't iterate over the indexes, since they can change after moving rows
-        for idx in range(len(selection)):
-            if selection[0].row() == 0:
-                return
-            self.model().beginMoveRows(self.rootIndex(), selection[0].row(), selection[0].row(), self.rootIndex(), 0)
-            self.model().endMoveRows()
-            selection = sorted(self.selectedIndexes(), reverse=True)
+        # Moving a track up doesn't change the rows of the selected tracks below it
+        for idx, row in enumerate(sorted(idx.row() for idx in self.selectedIndexes())):
+            self.trackModel.moveRow(QModelIndex(), row, QModelIndex(), idx)
+        self.scrollToTop()
 
     def move_to_bottom(self):
-        bottomIdx = len(self)
-        selection = sorted(self.selectedIndexes())
-        # We can't iterate over the indexes, since they can change after moving rows
-        for idx in range(len(selection)):
-            if selection[0].row() == bottomIdx - idx:
-                return
-            self.model().beginMoveRows(self.rootIndex(), selection[0].row(), selection[0].row(), self.rootIndex(), bottomIdx)
-            self.model().endMoveRows()
-            selection = sorted(self.selectedIndexes())
+        bottomIdx = len(self.trackModel)
+        # Moving a track down doesn't change the rows of the selected tracks above it
+        for idx, row in enumerate(sorted((idx.row() for idx in self.selectedIndexes()), reverse=True)):
+            self.trackModel.moveRow(QModelIndex(), row, QModelIndex(), bottomIdx - idx)
         self.scrollToBottom()
 
     def remove_from_playlist(self):
-        selection = self.selectedItems()
-        if len(selection) > 0:
-            tracks = [self.itemWidget(item).playlistTrack for item in selection]
-            self.removeFromPlaylist.emit(tracks)
-            for item in selection:
-                self.takeItem(self.indexFromItem(item).row())
-            self.update_indexes(None, 0, None, None, 0)
+        rows = sorted(idx.row() for idx in self.selectedIndexes())
+        if len(rows) > 0:
+            self.removeFromPlaylist.emit(self.selected_tracks())
+            for row in reversed(rows):
+                self.trackModel.removeRow(row)
+            self.trackModel.update_indexes()
 
     def move_alphabetical(self):
-        selection = sorted(self.selectedIndexes())[0]
-        searchIndex = 1
-        artist = self.indexWidget(selection).playlistTrack.track.artists[0]
-        nextArtist = self.indexWidget(selection.siblingAtRow(selection.row() - searchIndex)).playlistTrack.track.artists[0]
-        while artist < nextArtist:
-            searchIndex += 1
-            nextArtist = self.indexWidget(selection.siblingAtRow(selection.row() - searchIndex)).playlistTrack.track.artists[0]
-
-        self.model().beginMoveRows(self.rootIndex(), selection.row(), selection.row(), self.rootIndex(), selection.row() - searchIndex + 1)
-        self.model().endMoveRows()
-        self.scrollTo(selection.siblingAtRow(selection.row() - searchIndex + 1))
+        row = sorted(self.selectedIndexes())[0].row()
+        tracks = self.trackModel.tracks
+        artist = tracks[row].track.artists[0]
+        targetRow = row
+        while targetRow > 0 and artist < tracks[targetRow - 1].track.artists[0]:
+            targetRow -= 1
+
+        self.trackModel.moveRow(QModelIndex(), row, QModelIndex(), targetRow)
+        self.scrollTo(self.trackModel.index(targetRow))
 
     def add_to_playlist(self, playlistIndex):
-        selection = self.selectedItems()
         tracks = []
-        for item in selection:
-            track = self.itemWidget(item).playlistTrack
+        for track in self.selected_tracks():
             if not track.isLocal:
                 tracks.append(track.track)
 
         self.addToPlaylist.emit(self.playlistList[playlistIndex.data()], tracks)
 
+    def play_track(self, index: QModelIndex):
+        self.playTrack.emit(index.data(TrackListModel.PlaylistTrackRole).track.trackUri)
+
+    def image_ready(self, uri: str):
+        self.viewport().update()
+
+    def resizeEvent(self, e) -> None:
+        super().resizeEvent(e)
+        self.update_cover_rows()
+
+    def update_cover_rows(self):
+        # Covers are only kept for the visible rows and a margin around them, however long the playlist is
+        tracks = self.trackModel.tracks
+        if len(tracks) == 0:
+            return
+        first = self.indexAt(self.viewport().rect().topLeft()).row()
+        last = self.indexAt(self.viewport().rect().bottomLeft()).row()
+        if first == -1:
+            first = 0
+        if last == -1:
+            last = min(len(tracks) - 1, first + self.viewport().height() // self.itemDelegate().rowHeight)
+        coverRows = range(max(0, first - self.coverPrefetchRows), min(len(tracks), last + self.coverPrefetchRows + 1))
+        if coverRows == self.coverRows:
+            return
+
+        size = self.itemDelegate().albumCoverSize
+        keptUris = set(tracks[row].track.albumCoverUri for row in coverRows)
+        for row in self.coverRows:
+            if row not in coverRows and row < len(tracks) and tracks[row].track.albumCoverUri not in keptUris:
+                release_scaled_image(tracks[row].track.albumCoverUri, size)
+        # Visible rows ask for their covers when they are painted, this only loads the ones around them
+        for row in coverRows:
+            if row not in self.coverRows and not first <= row <= last:
+                prefetch_scaled_image(tracks[row].track.albumCoverUri, size)
+        self.coverRows = coverRows
+
     def update_indexes(self, idx1: QModelIndex, start, stop, idx2: QModelIndex, row):
         self.orderChanged.emit(start, row)
-        widgets = []
-        for idx in range(len(self)):
-            widgets.append(self.itemWidget(self.item(idx)))
-        for idx, widget in enumerate(widgets):
-            widget.indexLabel.setText(str(idx + 1))
-            widget.playlistTrack.index = idx + 1
-        self.scrollToTop()
+        self.trackModel.update_indexes()
 
-    def add_widget(self, itemWidget):
-        myQListWidgetItem = QListWidgetItem(self)
-        myQListWidgetItem.setSizeHint(itemWidget.sizeHint())
-        self.addItem(myQListWidgetItem)
-        self.setItemWidget(myQListWidgetItem, itemWidget)
+    def add_tracks(self, playlistTracks: list):
+        self.trackModel.add_tracks(playlistTracks)
 
     def update_playlist_list(self, playlistList):
         self.playlistList = playlistList
+
+    def __len__(self):
+        return len(self.trackModel)